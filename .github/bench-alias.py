@@ -0,0 +1,96 @@
+"""
+别名查找对比：旧版逐个遍历别名与别名索引
+在 .github 目录下运行 python bench-alias.py，使用插件自带的 item-alias.json
+"""
+
+import sys
+import json
+import shutil
+import asyncio
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import nonebot
+
+DATA = Path("../data/gsmaterial")
+TYPO_CHARS = "湖克云星花风月山水火"  # 替换到名称中模拟错字
+sys.path.insert(0, "..")
+nonebot.init(
+    driver="~none",
+    gsmaterial_config=shutil.copytree(DATA, Path(tempfile.mkdtemp()) / "gsmaterial"),
+    log_level="WARNING",
+)
+
+from nonebot_plugin_gsmaterial.alias import ALIAS_INDEX  # noqa: E402
+from nonebot_plugin_gsmaterial.data_source import get_target  # noqa: E402
+
+ITEM_ALIAS = json.loads((DATA / "item-alias.json").read_text(encoding="UTF-8"))
+ALL_ALIAS = {a.lower() for aliases in ITEM_ALIAS.values() for a in aliases}
+ALIAS_INDEX.load(ITEM_ALIAS)
+
+
+def old_get_target(alias: str):
+    """旧版查找，逐个遍历全部别名"""
+
+    alias = alias.lower()
+    for item_id, item_alias in ITEM_ALIAS.items():
+        if alias in item_alias:
+            return int(item_id), item_alias[0]
+    return 0, alias
+
+
+def new_get_target(alias: str):
+    return asyncio.run(get_target(alias))
+
+
+def typos():
+    """每个名称的每个位置替换一个字，跳过恰好构成其他别名的结果"""
+
+    for item_id, aliases in ITEM_ALIAS.items():
+        name = aliases[0] if aliases else ""
+        for pos in range(len(name)):
+            for char in TYPO_CHARS:
+                typo = name[:pos] + char + name[pos + 1 :]
+                if typo.lower() not in ALL_ALIAS:
+                    yield int(item_id), name, typo
+                    break
+
+
+# 精确查找耗时，遍历全部别名
+queries = sorted(ALL_ALIAS)
+start = perf_counter()
+for q in queries:
+    old_get_target(q)
+old_cost = perf_counter() - start
+start = perf_counter()
+for q in queries:
+    ALIAS_INDEX.search(q, 2)
+new_cost = perf_counter() - start
+print(
+    f"精确查找 {len(queries)} 个别名："
+    f"旧版 {old_cost * 1000:.1f}ms，新版 {new_cost * 1000:.1f}ms"
+)
+
+# 错字识别，按名称长度分组统计
+stats = {}
+for item_id, name, typo in typos():
+    group = stats.setdefault(min(len(name), 4), [0, 0, 0, 0, 0])
+    new_id = new_get_target(typo)[0]
+    group[0] += 1
+    group[1] += old_get_target(typo)[0] == item_id
+    group[2] += new_id == item_id
+    group[3] += bool(new_id) and new_id != item_id
+    group[4] += item_id in [c[0] for c in ALIAS_INDEX.search(typo, 3)]
+for length, (total, old, auto, wrong, suggest) in sorted(stats.items()):
+    print(
+        f"{length}{'+' if length == 4 else ''} 字名称错一字 {total} 个："
+        f"旧版识别 {old}，新版自动识别 {auto}（错误 {wrong}），候选中包含 {suggest}"
+    )
+
+# 含义不明确的输入不应自动选择
+for q in ["雷", "天", "a", "雷电"]:
+    print(
+        f"输入「{q}」：旧版 {old_get_target(q)}，新版 {new_get_target(q)}，"
+        f"候选 {[c[1] for c in ALIAS_INDEX.search(q, 3)]}"
+    )
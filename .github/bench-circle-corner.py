@@ -0,0 +1,73 @@
+"""
+circle_corner 性能对比：旧版 5 倍超采样与缓存圆角蒙版
+在 .github 目录下运行 python bench-circle-corner.py，使用插件自带的稀有度背景图
+"""
+
+import sys
+import shutil
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import nonebot
+from PIL import Image, ImageDraw, ImageChops, ImageStat
+
+DATA = Path("../data/gsmaterial")
+ROUNDS = 200
+sys.path.insert(0, "..")
+nonebot.init(
+    driver="~none",
+    gsmaterial_config=shutil.copytree(DATA, Path(tempfile.mkdtemp()) / "gsmaterial"),
+    log_level="WARNING",
+)
+
+from nonebot_plugin_gsmaterial.material_draw import (  # noqa: E402
+    RESAMPLING,
+    corner_mask,
+    circle_corner,
+)
+
+
+def old_circle_corner(mark_img: Image.Image, radius: int = 30) -> Image.Image:
+    """旧版圆角处理，放大 5 倍绘制圆形后缩小"""
+
+    mark_img = mark_img.convert("RGBA")
+    scale, radius = 5, radius * 5
+    mark_img = mark_img.resize(
+        (mark_img.size[0] * scale, mark_img.size[1] * scale), RESAMPLING
+    )
+    w, h = mark_img.size
+    circle = Image.new("L", (radius * 2, radius * 2), 0)
+    draw = ImageDraw.Draw(circle)
+    draw.ellipse((0, 0, radius * 2, radius * 2), fill=255)
+    alpha = Image.new("L", mark_img.size, 255)
+    alpha.paste(circle.crop((0, 0, radius, radius)), (0, 0))
+    alpha.paste(circle.crop((radius, 0, radius * 2, radius)), (w - radius, 0))
+    alpha.paste(
+        circle.crop((radius, radius, radius * 2, radius * 2)),
+        (w - radius, h - radius),
+    )
+    alpha.paste(circle.crop((0, radius, radius, radius * 2)), (0, h - radius))
+    mark_img.putalpha(alpha)
+    return mark_img.resize((int(w / scale), int(h / scale)), RESAMPLING)
+
+
+def timeit(func, *args) -> float:
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (perf_counter() - start) / ROUNDS * 1000
+
+
+for bg in sorted((DATA / "draw").glob("bg*.140.png")):
+    tile = Image.open(bg).convert("RGBA")
+    for radius in [10, 30]:
+        corner_mask.cache_clear()
+        old, new = old_circle_corner(tile, radius), circle_corner(tile, radius)
+        diff = ImageChops.difference(old.getchannel("A"), new.getchannel("A"))
+        print(
+            f"{bg.name} 圆角 {radius}："
+            f"旧版 {timeit(old_circle_corner, tile, radius):.2f}ms/次，"
+            f"新版 {timeit(circle_corner, tile, radius):.2f}ms/次，"
+            f"透明度平均差 {ImageStat.Stat(diff).mean[0]:.2f}"
+        )
@@ -1,14 +1,16 @@
-from asyncio import sleep as async_sleep
-from random import randint
-from typing import Dict
+import asyncio
+from typing import Set
 
-from nonebot import get_bot, get_driver, require
+from nonebot import get_bot, get_bots, get_driver, require
 from nonebot.adapters.onebot.v11 import Bot
 from nonebot.adapters.onebot.v11.event import GroupMessageEvent, MessageEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment
+from nonebot.log import logger
 from nonebot.plugin import on_command
 from nonebot.typing import T_State
 
+from .alias import start_alias_refresh
+from .client import close_clients, open_clients
 from .config import SCHED_HOUR, SCHED_MINUTE, WEEKLY_BOSS
 from .data_source import (
     generate_calc_msg,
@@ -17,6 +19,9 @@ from .data_source import (
     sub_helper,
     update_config,
 )
+from .push import PUSH_PROGRESS, BotShards, push_lock, push_running, run_push
+from .render import render_executor
+from .subscribe import SUB_STORE
 
 require("nonebot_plugin_apscheduler")
 from nonebot_plugin_apscheduler import scheduler  # noqa: E402
@@ -25,7 +30,13 @@ mt_daily_matcher = on_command("材料", priority=13)
 mt_weekly_matcher = on_command("周本", priority=13)
 mt_calc_matcher = on_command("原神计算", priority=13)
 driver = get_driver()
+driver.on_startup(open_clients)
+driver.on_startup(start_alias_refresh)
+driver.on_shutdown(close_clients)
 driver.on_bot_connect(update_config)
+driver.on_shutdown(render_executor.shutdown)
+_resume_tasks: Set[asyncio.Task] = set()
+_resume_queued = False
 
 
 @mt_daily_matcher.handle()
@@ -41,7 +52,7 @@ async def daily_material(bot: Bot, event: MessageEvent, state: T_State):
         await mt_daily_matcher.finish(
             MessageSegment.text(msg)
             if isinstance(msg, str)
-            else MessageSegment.image(msg)
+            else MessageSegment.image(msg.payload)
         )
 
     # 单独响应订阅指令
@@ -50,6 +61,16 @@ async def daily_material(bot: Bot, event: MessageEvent, state: T_State):
         is_group = isinstance(event, GroupMessageEvent)
         action = f"{'d' if is_delete else 'a'}{'g' if is_group else 'p'}"
         action_id = event.group_id if is_group else qq
+        # 订阅内容，可只订阅天赋或武器材料，以及是否包含三星物品
+        variant = (
+            "avatar"
+            if any(x in arg for x in ["天赋", "角色"])
+            else "weapon"
+            if "武器" in arg
+            else "all"
+        )
+        if "三星" in arg:
+            variant += ".4" if any(x in arg for x in ["不含", "不要", "跳过"]) else ".3"
         if (
             is_group
             and qq not in bot.config.superusers
@@ -58,7 +79,9 @@ async def daily_material(bot: Bot, event: MessageEvent, state: T_State):
             await mt_daily_matcher.finish(
                 f"你没有权限{'删除' if is_delete else '启用'}此群原神每日材料订阅！"
             )
-        await mt_daily_matcher.finish(await sub_helper(action, action_id))  # type: ignore
+        await mt_daily_matcher.finish(
+            await sub_helper(action, action_id, variant)  # type: ignore
+        )
 
     # 识别周几，也可以是纯数字
     weekday, timedelta = 0, 0
@@ -88,7 +111,9 @@ async def daily_material(bot: Bot, event: MessageEvent, state: T_State):
     # 获取每日材料图片
     msg = await generate_daily_msg(target, weekday, timedelta)
     await mt_daily_matcher.finish(
-        MessageSegment.text(msg) if isinstance(msg, str) else MessageSegment.image(msg)
+        MessageSegment.text(msg)
+        if isinstance(msg, str)
+        else MessageSegment.image(msg.payload)
     )
 
 
@@ -110,7 +135,9 @@ async def weekly_material(bot: Bot, event: MessageEvent, state: T_State):
     # 获取周本材料图片
     msg = await generate_weekly_msg(target)
     await mt_weekly_matcher.finish(
-        MessageSegment.text(msg) if isinstance(msg, str) else MessageSegment.image(msg)
+        MessageSegment.text(msg)
+        if isinstance(msg, str)
+        else MessageSegment.image(msg.payload)
     )
 
 
@@ -119,25 +146,85 @@ async def calc_material(bot: Bot, event: MessageEvent, state: T_State):
     arg = str(state["_prefix"]["command_arg"])
     msg = await generate_calc_msg(arg)
     await mt_weekly_matcher.finish(
-        MessageSegment.text(msg) if isinstance(msg, str) else MessageSegment.image(msg)
+        MessageSegment.text(msg)
+        if isinstance(msg, str)
+        else MessageSegment.image(msg.payload)
     )
 
 
 @scheduler.scheduled_job("cron", hour=int(SCHED_HOUR), minute=int(SCHED_MINUTE))
 async def daily_push():
-    bot = get_bot()
-    # 获取订阅配置
-    cfg = await sub_helper()
-    assert isinstance(cfg, Dict)
-    # 更新每日材料图片
-    msg = await generate_daily_msg("update")
-    message = (
-        MessageSegment.text(msg) if isinstance(msg, str) else MessageSegment.image(msg)
-    )
-    # 推送
-    for group in cfg.get("群组", []):
-        await bot.send_group_msg(group_id=group, message=message)
-        await async_sleep(randint(5, 10))
-    for private in cfg.get("私聊", []):
-        await bot.send_private_msg(user_id=private, message=message)
-        await async_sleep(randint(5, 10))
+    global _resume_queued
+    # 生成图片前即持有推送锁，重复触发的推送直接跳过
+    if push_running():
+        logger.info("每日材料推送正在进行，跳过本次触发")
+        return
+    async with push_lock():
+        # 按订阅内容分组，每种内容只生成一次图片，优先使用缓存的图片
+        variants = SUB_STORE.by_variant()
+        msgs = await asyncio.gather(
+            *[generate_daily_msg(need, skip_three=skip) for need, skip in variants]
+        )
+        segments = [
+            MessageSegment.text(msg)
+            if isinstance(msg, str)
+            else MessageSegment.image(msg.payload)
+            for msg in msgs
+        ]
+        messages = {
+            target: segment
+            for segment, targets in zip(segments, variants.values())
+            for target in targets
+        }
+
+        async def _send(bot_id: str, target: str) -> None:
+            bot, message = get_bot(bot_id), messages[target]
+            target_type, target_id = target.split(":", 1)
+            if target_type == "群组":
+                await bot.send_group_msg(group_id=int(target_id), message=message)
+            else:
+                await bot.send_private_msg(user_id=int(target_id), message=message)
+
+        # 按各 Bot 可触达的群组、好友分片，限速并发推送
+        bots = get_bots()
+        reach = await asyncio.gather(*[bot_reach(bot) for bot in bots.values()])
+        await run_push(
+            list(messages),
+            _send,
+            BotShards(dict(zip(bots, reach)), lambda: get_bots().keys()),
+        )
+    # 推送期间有 Bot 连接时，继续推送因没有在线 Bot 而剩余的目标
+    if _resume_queued:
+        _resume_queued = False
+        await resume_daily_push()
+
+
+async def bot_reach(bot: Bot) -> Set[str]:
+    # Bot 所在的群组及好友，获取失败时视为未知
+    try:
+        groups = await bot.get_group_list()
+        friends = await bot.get_friend_list()
+    except Exception as e:
+        logger.warning(f"Bot {bot.self_id} 群组、好友列表获取失败：{e!r}")
+        return set()
+    return {f"群组:{g['group_id']}" for g in groups} | {
+        f"私聊:{f['user_id']}" for f in friends
+    }
+
+
+async def resume_daily_push():
+    global _resume_queued
+    # 推送中途重启时，Bot 重新连接后继续推送剩余目标
+    if not PUSH_PROGRESS.unfinished():
+        return
+    if push_running():
+        # 当前推送结束后再继续，重新连接的 Bot 参与分配
+        _resume_queued = True
+        return
+    logger.info("继续今日未完成的每日材料推送")
+    task = asyncio.create_task(daily_push())
+    _resume_tasks.add(task)
+    task.add_done_callback(_resume_tasks.discard)
+
+
+driver.on_bot_connect(resume_daily_push)
@@ -0,0 +1,166 @@
+import json
+import asyncio
+from bisect import bisect_left
+from typing import Dict, List, Tuple, Iterable, Optional
+
+from nonebot.log import logger
+
+from .client import conditional_get
+from .config import ALIAS_URL, CONFIG_DIR, ITEM_ALIAS
+
+SHORT_QUERY = 3  # 不超过该长度的输入使用按长度分桶的模糊匹配
+
+
+def _grams(text: str) -> List[str]:
+    """二元分词，单字时返回自身"""
+
+    return [text[i : i + 2] for i in range(len(text) - 1)] or [text]
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """编辑距离，超过 ``limit`` 时提前返回 ``limit + 1``"""
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class AliasIndex:
+    """
+    角色、武器别名索引，由 ``item-alias.json`` 一次性构建
+    * 精确匹配：别名到 ID 的哈希表
+    * 前缀匹配：有序别名列表二分查找
+    * 模糊匹配：二元分词倒排索引筛选候选后计算编辑距离
+    * 短名称模糊匹配：不超过 3 字的输入与长度相近的别名逐个计算编辑距离
+    """
+
+    def __init__(self, item_alias: Dict[str, List[str]]) -> None:
+        self.load(item_alias)
+
+    def load(self, item_alias: Dict[str, List[str]]) -> None:
+        """由别名数据重新构建索引，构建完成后一次性替换，查找不会读到半成品"""
+
+        exact: Dict[str, int] = {}
+        names: Dict[int, str] = {}
+        grams: Dict[str, List[str]] = {}
+        by_len: Dict[int, List[str]] = {}
+        for item_id, aliases in item_alias.items():
+            if not aliases:
+                continue
+            names[int(item_id)] = aliases[0]
+            for alias in aliases:
+                alias = alias.lower()
+                if alias in exact:
+                    # 别名重复时保留先出现的，与逐个遍历的行为一致
+                    continue
+                exact[alias] = int(item_id)
+                for gram in set(_grams(alias)):
+                    grams.setdefault(gram, []).append(alias)
+                by_len.setdefault(len(alias), []).append(alias)
+        self._table = (exact, names, grams, sorted(exact), by_len)
+
+    def __len__(self) -> int:
+        return len(self._table[1])
+
+    def ids(self) -> List[int]:
+        """全部角色、武器 ID"""
+
+        return list(self._table[1])
+
+    def _prefixed(self, query: str, limit: int) -> Iterable[str]:
+        sorted_alias = self._table[3]
+        idx = bisect_left(sorted_alias, query)
+        while idx < len(sorted_alias) and limit:
+            alias = sorted_alias[idx]
+            if not alias.startswith(query):
+                break
+            yield alias
+            idx, limit = idx + 1, limit - 1
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[int, str, float]]:
+        """
+        别名查找
+        * ``param query: str`` 输入的名称
+        * ``param limit: int = 5`` 返回候选数量上限
+        - ``return: List[Tuple[int, str, float]]`` 按得分降序排列的 ID、真实名称、得分
+        """
+
+        exact, names, grams, _, by_len = self._table
+        query = query.lower().strip()
+        if not query:
+            return []
+        if query in exact:
+            item_id = exact[query]
+            return [(item_id, names[item_id], 1.0)]
+
+        scores: Dict[int, float] = {}
+
+        def _add(alias: str, score: float) -> None:
+            item_id = exact[alias]
+            if score > scores.get(item_id, 0):
+                scores[item_id] = score
+
+        # 前缀匹配，输入越接近完整别名得分越高
+        for alias in self._prefixed(query, 50):
+            _add(alias, 0.5 + 0.4 * len(query) / len(alias))
+
+        # 模糊匹配，至少共享一个二元分词的别名才计算编辑距离
+        # 短名称错一个字时不共享任何二元分词，改为比较长度相差不超过 1 的全部别名
+        max_dist = max(1, len(query) // 3)
+        if len(query) <= SHORT_QUERY:
+            candidates = {
+                alias
+                for length in range(len(query) - 1, len(query) + 2)
+                for alias in by_len.get(length, [])
+            }
+        else:
+            candidates = {
+                alias for gram in set(_grams(query)) for alias in grams.get(gram, [])
+            }
+        for alias in candidates:
+            dist = _distance(query, alias, max_dist)
+            if dist <= max_dist:
+                _add(alias, 0.8 * (1 - dist / max(len(query), len(alias))))
+
+        ranked = sorted(scores.items(), key=lambda i: (-i[1], len(names[i[0]])))
+        return [(item_id, names[item_id], score) for item_id, score in ranked][:limit]
+
+
+ALIAS_INDEX = AliasIndex(ITEM_ALIAS)
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def refresh_alias() -> None:
+    """从 CDN 条件请求最新别名，发生变化时写入本地并替换索引"""
+
+    alias_file = CONFIG_DIR / "item-alias.json"
+    try:
+        item_alias, changed = await conditional_get(
+            ALIAS_URL, CONFIG_DIR / "cache" / "item-alias.json", verify=False
+        )
+    except Exception as e:
+        logger.opt(exception=e).warning("角色、武器别名更新失败，继续使用本地别名")
+        return
+    if not changed and alias_file.exists() and len(ALIAS_INDEX):
+        logger.debug("角色、武器别名未变化")
+        return
+    alias_file.write_text(
+        json.dumps(item_alias, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    ALIAS_INDEX.load(item_alias)
+    logger.info(f"角色、武器别名更新完成，共 {len(ALIAS_INDEX)} 个条目")
+
+
+async def start_alias_refresh() -> None:
+    """NoneBot2 启动时在后台更新别名，不阻塞启动"""
+
+    global _refresh_task
+    _refresh_task = asyncio.create_task(refresh_alias())
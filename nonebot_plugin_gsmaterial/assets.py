@@ -0,0 +1,180 @@
+import os
+import json
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple, Callable, Optional, Awaitable
+
+from nonebot.log import logger
+
+from .config import DL_CFG, DL_MIRROR, CONFIG_DIR, DL_CONCURRENCY
+
+
+def asset_target(url: str, type: str, rename: str) -> Tuple[str, Path]:
+    """根据下载类型确定完整下载链接及保存路径"""
+
+    if type == "draw":
+        # 插件绘图素材，通过阿里云 CDN 下载
+        return (
+            f"https://cdn.monsterx.cn/bot/gsmaterial/{url}",
+            CONFIG_DIR / "draw" / url,
+        )
+    elif type == "mihoyo":
+        # 通过米游社下载的文件，主要为米游社计算器材料图标
+        return url, DL_CFG["item"]["dir"] / rename
+    # 可通过镜像下载的文件，主要为角色头像、武器图标、天赋及武器突破材料图标
+    return DL_MIRROR + url, DL_CFG[type]["dir"] / rename
+
+
+def is_valid_asset(name: str, size: int) -> bool:
+    """测试角色图像为白色问号，该图片 st_size = 5105，小于 6KB 的 PNG 均视为无效图片"""
+
+    return size > 0 and not (name.lower().endswith("png") and size < 6144)
+
+
+class AssetManifest:
+    """
+    已下载文件清单，记录每个文件的大小
+    * 文件大小与清单一致即视为有效，不再读取文件内容
+    * 清单外已存在的有效文件在首次校验时补录
+    * 清单有变化时才写入磁盘
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._dirty = False
+        try:
+            self._entries: Dict[str, List] = json.loads(
+                path.read_text(encoding="UTF-8")
+            )
+        except (OSError, json.decoder.JSONDecodeError):
+            self._entries = {}
+
+    def check(self, f: Path, size: Optional[int]) -> bool:
+        entry = self._entries.get(str(f))
+        return size is not None and entry is not None and entry[0] == size
+
+    def record(self, f: Path, size: int) -> None:
+        if self.check(f, size):
+            return
+        self._entries[str(f)] = [size]
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="UTF-8")
+        os.replace(tmp, self.path)
+
+
+MANIFEST = AssetManifest(CONFIG_DIR / "cache" / "manifest.json")
+SCAN_THRESHOLD = 32  # 同一文件夹中待校验文件不少于该数量时整体扫描
+
+
+class DownloadPlan:
+    """
+    资源下载计划，先汇总全部所需文件并去重，再统一校验、并发下载缺失文件
+    * ``param fetch: Callable[..., Awaitable[Optional[Path]]]`` 单个文件的下载函数
+    * ``param concurrency: int`` 同时下载的文件数量
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[..., Awaitable[Optional[Path]]],
+        concurrency: int = DL_CONCURRENCY,
+    ) -> None:
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self._items: Dict[Path, Tuple[str, str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def files(self) -> List[Path]:
+        """计划中全部文件的保存路径"""
+
+        return list(self._items)
+
+    def add(self, url: str, type: str, rename: str = "") -> None:
+        """加入计划，保存路径相同的文件只下载一次"""
+
+        self._items.setdefault(asset_target(url, type, rename)[1], (url, type, rename))
+
+    def _sizes(self) -> Dict[Path, int]:
+        folders: Dict[Path, List[Path]] = {}
+        for f in self._items:
+            folders.setdefault(f.parent, []).append(f)
+        sizes: Dict[Path, int] = {}
+        for folder, files in folders.items():
+            if len(files) < SCAN_THRESHOLD:
+                # 计算器等少量文件逐个查询，不扫描整个文件夹
+                for f in files:
+                    try:
+                        sizes[f] = f.stat().st_size
+                    except OSError:
+                        continue
+                continue
+            try:
+                with os.scandir(folder) as entries:
+                    sizes.update(
+                        (folder / e.name, e.stat().st_size)
+                        for e in entries
+                        if e.is_file()
+                    )
+            except FileNotFoundError:
+                continue
+        return sizes
+
+    def pending(self) -> List[Path]:
+        """对照清单找出需要下载的文件，文件较多的文件夹只扫描一次"""
+
+        sizes = self._sizes()
+        pending, adopted = [], 0
+        for f in self._items:
+            size = sizes.get(f)
+            if MANIFEST.check(f, size):
+                continue
+            if size is not None and is_valid_asset(f.name, size):
+                # 清单外已存在的有效文件直接补录
+                MANIFEST.record(f, size)
+                adopted += 1
+                continue
+            pending.append(f)
+        if adopted:
+            logger.debug(f"已有的 {adopted} 个文件补录到下载清单")
+        return pending
+
+    async def run(self) -> int:
+        """
+        执行下载计划
+        - ``return: int`` 下载失败的文件数量
+        """
+
+        pending = self.pending()
+        total, done, failed = len(pending), 0, 0
+        if not total:
+            MANIFEST.save()
+            logger.debug(f"下载计划中的 {len(self)} 个文件均已存在")
+            return 0
+        logger.info(f"下载计划共 {len(self)} 个文件，需要下载 {total} 个")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        step = max(total // 10, 1)
+
+        async def _fetch(f: Path) -> None:
+            nonlocal done, failed
+            async with semaphore:
+                res = await self.fetch(*self._items[f], check=False)
+            size = res.stat().st_size if res and res.exists() else 0
+            if res and is_valid_asset(res.name, size):
+                MANIFEST.record(res, size)
+            else:
+                failed += 1
+            done += 1
+            if done % step == 0 or done == total:
+                logger.info(f"下载进度 {done}/{total}，失败 {failed} 个")
+
+        await asyncio.gather(*[_fetch(f) for f in pending])
+        MANIFEST.save()
+        return failed
@@ -0,0 +1,100 @@
+import os
+import json
+import mmap
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Tuple, Iterable, Optional
+
+from PIL import Image
+
+from nonebot.log import logger
+
+ICON_SIZE = 140
+ICON_BYTES = ICON_SIZE * ICON_SIZE * 4
+
+
+class IconAtlas:
+    """
+    图标图集，将已解码并缩放为 140×140 的 RGBA 图标依次写入同一个二进制文件
+    * ``atlas.bin`` 图标原始像素数据，读取时通过 mmap 映射，不复制
+    * ``atlas.json`` 源图标路径到偏移量、源图标修改时间的索引，无法解码的图标偏移量为 -1
+    """
+
+    def __init__(self, atlas_dir: Path) -> None:
+        self.bin_file = atlas_dir / "atlas.bin"
+        self.index_file = atlas_dir / "atlas.json"
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._map: Optional[mmap.mmap] = None
+        self._loaded = False
+        self._lock = Lock()
+
+    def load(self) -> None:
+        """重新映射图集文件，旧映射在引用它的图片释放后自动关闭"""
+
+        with self._lock:
+            self._loaded, self._index, self._map = True, {}, None
+            try:
+                index = json.loads(self.index_file.read_text(encoding="UTF-8"))
+                with open(self.bin_file, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return
+            self._index = {k: (v[0], v[1]) for k, v in index.items()}
+
+    def covers(self, icon_paths: Iterable[Path]) -> bool:
+        """图集是否包含全部图标且均未过期"""
+
+        if not self._loaded:
+            self.load()
+        for icon_path in icon_paths:
+            try:
+                src_mtime = icon_path.stat().st_mtime_ns
+            except OSError:
+                # 下载失败的图标不要求包含在图集中
+                continue
+            entry = self._index.get(str(icon_path))
+            if not entry or entry[1] != src_mtime:
+                return False
+        return True
+
+    def icon(self, icon_path: Path, src_mtime: int) -> Optional[Image.Image]:
+        """
+        从图集中读取图标
+        * ``param icon_path: Path`` 源图标路径
+        * ``param src_mtime: int`` 源图标修改时间，与图集记录不一致时视为未命中
+        - ``return: Optional[Image.Image]`` 直接引用映射内存的只读图片，未命中时返回空
+        """
+
+        if not self._loaded:
+            self.load()
+        entry, atlas_map = self._index.get(str(icon_path)), self._map
+        if not entry or entry[1] != src_mtime or entry[0] < 0 or atlas_map is None:
+            return None
+        data = memoryview(atlas_map)[entry[0] : entry[0] + ICON_BYTES]
+        return Image.frombuffer(
+            "RGBA", (ICON_SIZE, ICON_SIZE), data, "raw", "RGBA", 0, 1
+        )
+
+    def write(self, icons: Iterable[Tuple[Path, int, Optional[bytes]]]) -> int:
+        """
+        写入新图集，写完后整体替换旧文件
+        * ``param icons: Iterable[Tuple[Path, int, Optional[bytes]]]`` 源图标路径、修改时间及像素数据
+        * 无法解码的图标像素数据为空，只记录修改时间
+        - ``return: int`` 写入的图标数量
+        """
+
+        index: Dict[str, List[int]] = {}
+        tmp_bin = self.bin_file.with_name("atlas.bin.tmp")
+        with open(tmp_bin, "wb") as f:
+            for icon_path, src_mtime, data in icons:
+                # 图标未变化时 covers 仍视为已包含，不再重建图集
+                index[str(icon_path)] = [f.tell() if data else -1, src_mtime]
+                if data:
+                    f.write(data)
+        tmp_index = self.index_file.with_name("atlas.json.tmp")
+        tmp_index.write_text(json.dumps(index, ensure_ascii=False), encoding="UTF-8")
+        os.replace(tmp_bin, self.bin_file)
+        os.replace(tmp_index, self.index_file)
+        count = sum(1 for v in index.values() if v[0] >= 0)
+        logger.debug(f"图标图集写入完成，共 {count} 个图标，跳过 {len(index) - count} 个")
+        return count
@@ -0,0 +1,171 @@
+import json
+from time import time
+from hashlib import md5
+from pathlib import Path
+from base64 import b64encode
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+from typing import Any, Dict, Tuple, Optional
+
+from nonebot.log import logger
+
+from .config import CALC_MAX, CALC_TTL, CACHE_SIZE, CONFIG_DIR
+
+
+class CachedImage:
+    """已编码的图片，``payload`` 可直接传给 ``MessageSegment.image``"""
+
+    __slots__ = ("data", "digest", "_payload", "__weakref__")
+
+    def __init__(self, data: bytes, digest: str = "") -> None:
+        self.data = data
+        self.digest = digest or md5(data).hexdigest()
+        self._payload: Optional[str] = None
+
+    @property
+    def payload(self) -> str:
+        """``base64://`` 形式的图片，首次使用时编码"""
+
+        if self._payload is None:
+            self._payload = f"base64://{b64encode(self.data).decode()}"
+        return self._payload
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + len(self._payload or "")
+
+
+class ImageCache:
+    """
+    已生成图片的内存缓存，以 ``(类型, 日期或周本, 配置版本)`` 为键
+    * ``param budget: int`` 内存预算字节数，超出时淘汰最久未使用的图片
+    * 内容相同的图片共享同一个 ``CachedImage``，base64 编码只进行一次
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.version = 0
+        self.hits, self.misses, self.shared = 0, 0, 0
+        self._items: "OrderedDict[Tuple[str, str, int], CachedImage]" = OrderedDict()
+        # 以内容哈希索引仍在使用的图片，图片重绘后内容变化自然不会命中
+        self._payloads: "WeakValueDictionary[str, CachedImage]" = (
+            WeakValueDictionary()
+        )
+
+    def _key(self, kind: str, name: str) -> Tuple[str, str, int]:
+        return kind, name, self.version
+
+    def get(self, kind: str, name: str) -> Optional[CachedImage]:
+        """读取缓存的图片，命中时将其标记为最近使用"""
+
+        key = self._key(kind, name)
+        image = self._items.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return image
+
+    def put(self, kind: str, name: str, data: bytes) -> CachedImage:
+        """写入图片并按内存预算淘汰，单张超出预算的图片不会缓存"""
+
+        digest = md5(data).hexdigest()
+        image = self._payloads.get(digest)
+        if image is None:
+            image = self._payloads[digest] = CachedImage(data, digest)
+        else:
+            self.shared += 1
+        # 编码后的 payload 约为原图的 4/3，两者合计不能超出预算
+        if len(data) * 3 > self.budget:
+            return image
+        self._items[self._key(kind, name)] = image
+        self._evict()
+        return image
+
+    def _total(self) -> int:
+        return sum(i.size for i in {i.digest: i for i in self._items.values()}.values())
+
+    def _evict(self) -> None:
+        while self._items and self._total() > self.budget:
+            self._items.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """图片重绘后调用，递增配置版本并丢弃旧版本的全部图片"""
+
+        self.version += 1
+        self._items.clear()
+        logger.debug(f"图片内存缓存已失效，当前版本 {self.version}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "count": len(self._items),
+            "bytes": self._total(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "version": self.version,
+        }
+
+
+IMAGE_CACHE = ImageCache(int(CACHE_SIZE * 1024 * 1024))
+
+
+class CalcCache:
+    """
+    材料计算结果磁盘缓存，以规范化的升级目标为键，保存米游社计算结果及绘制的图片
+    * ``param cache_dir: Path`` 缓存文件夹
+    * ``param ttl: int`` 有效期秒数
+    * ``param max_count: int`` 缓存数量上限，超出时删除最早写入的结果
+    """
+
+    def __init__(self, cache_dir: Path, ttl: int, max_count: int) -> None:
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_count = max_count
+
+    @staticmethod
+    def key(target: Dict) -> str:
+        """升级目标规范化后的哈希"""
+
+        normalized = json.dumps(target, sort_keys=True, separators=(",", ":"))
+        return md5(normalized.encode()).hexdigest()
+
+    def get(self, target: Dict) -> Optional[Tuple[Dict, bytes]]:
+        """读取未过期的计算结果及图片"""
+
+        key = self.key(target)
+        json_file = self.cache_dir / f"{key}.json"
+        png_file = json_file.with_suffix(".png")
+        if not (self.ttl and json_file.exists() and png_file.exists()):
+            return None
+        try:
+            cached = json.loads(json_file.read_text(encoding="UTF-8"))
+        except json.decoder.JSONDecodeError:
+            return None
+        if time() - cached["time"] > self.ttl:
+            return None
+        return cached["calculate"], png_file.read_bytes()
+
+    def put(self, target: Dict, calculate: Dict, image: bytes) -> None:
+        """写入计算结果及图片，超出数量上限时删除最早写入的结果"""
+
+        if not (self.ttl and self.max_count):
+            return
+        key = self.key(target)
+        (self.cache_dir / f"{key}.png").write_bytes(image)
+        (self.cache_dir / f"{key}.json").write_text(
+            json.dumps(
+                {"time": int(time()), "target": target, "calculate": calculate},
+                ensure_ascii=False,
+            ),
+            encoding="UTF-8",
+        )
+        cached = sorted(self.cache_dir.glob("*.json"), key=lambda f: f.stat().st_mtime)
+        for expired in cached[: max(len(cached) - self.max_count, 0)]:
+            expired.unlink(missing_ok=True)
+            expired.with_suffix(".png").unlink(missing_ok=True)
+
+
+CALC_CACHE = CalcCache(CONFIG_DIR / "cache" / "calc", CALC_TTL, CALC_MAX)
@@ -0,0 +1,106 @@
+import json
+from pathlib import Path
+from urllib.parse import urlsplit
+from typing import Any, Dict, Tuple
+
+from httpx import Limits, Timeout, AsyncClient
+
+from nonebot.log import logger
+
+from .config import MYS, AMBR, HTTP2, DL_MIRROR, HTTP_LIMIT, HTTP_TIMEOUT
+
+_clients: Dict[Tuple[str, bool], AsyncClient] = {}
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 需要额外安装 h2 依赖，缺失时回退至 HTTP/1.1"""
+
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("未安装 h2 依赖，HTTP/2 未启用，请使用 pip install httpx[http2] 安装")
+        return False
+    return True
+
+
+_HTTP2_ENABLED = _http2_enabled()
+
+
+def get_client(url: str, verify: bool = True) -> AsyncClient:
+    """按上游主机获取共享的 HTTP 客户端，同一主机的请求复用连接"""
+
+    key = (urlsplit(url).netloc, verify)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = AsyncClient(
+            verify=verify,
+            http2=_HTTP2_ENABLED,
+            limits=Limits(
+                max_connections=HTTP_LIMIT, max_keepalive_connections=HTTP_LIMIT
+            ),
+            timeout=Timeout(HTTP_TIMEOUT),
+        )
+        _clients[key] = client
+    return client
+
+
+async def conditional_get(
+    url: str, cache_file: Path, verify: bool = True
+) -> Tuple[Any, bool]:
+    """
+    带本地缓存的条件请求，上游返回 304 时直接使用缓存
+    * ``param url: str`` 请求链接，响应须为 JSON
+    * ``param cache_file: Path`` 缓存文件，保存响应及其 ETag、Last-Modified
+    * ``param verify: bool = True`` 是否校验证书
+    - ``return: Tuple[Any, bool]`` 响应 JSON 及其是否较缓存发生变化
+    """
+
+    cached: Dict = {}
+    if cache_file.exists():
+        try:
+            cached = json.loads(cache_file.read_text(encoding="UTF-8"))
+        except json.decoder.JSONDecodeError:
+            cached = {}
+    headers = {}
+    if "body" in cached:
+        if cached.get("etag"):
+            headers["if-none-match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["if-modified-since"] = cached["last_modified"]
+
+    res = await get_client(url, verify).get(url, headers=headers)
+    if res.status_code == 304 and "body" in cached:
+        return cached["body"], False
+    res.raise_for_status()
+    body = res.json()
+    cache_file.write_text(
+        json.dumps(
+            {
+                "etag": res.headers.get("etag"),
+                "last_modified": res.headers.get("last-modified"),
+                "body": body,
+            },
+            ensure_ascii=False,
+        ),
+        encoding="UTF-8",
+    )
+    return body, True
+
+
+async def open_clients() -> None:
+    """NoneBot2 启动时创建各上游主机的客户端"""
+
+    get_client(AMBR["每日采集"])
+    get_client(MYS["计算"])
+    get_client(DL_MIRROR, verify=False)
+    get_client("https://cdn.monsterx.cn/", verify=False)
+
+
+async def close_clients() -> None:
+    """NoneBot2 关闭时关闭所有客户端"""
+
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
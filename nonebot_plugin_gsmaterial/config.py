@@ -2,7 +2,6 @@ import json
 from pathlib import Path
 from typing import Tuple
 
-from httpx import Client
 from pytz import UnknownTimeZoneError, timezone
 
 from nonebot import get_driver
@@ -58,10 +57,80 @@ DL_MIRROR = str(
 SCHEDULER_TIME = str(getattr(_driver.config, "gsmaterial_scheduler", "8:10"))
 SCHED_HOUR, SCHED_MINUTE = SCHEDULER_TIME.split(":")
 
+# 材料图片编码：格式 jpeg 或 webp、质量、体积上限 KB（0 为不限制）
+# JPEG 是否渐进式编码、是否优化霍夫曼表，WebP 编码方法 0-6（越大越慢、体积越小）
+# 计算器图片是否量化为调色板 PNG
+# GSMATERIAL_IMAGE_FORMAT="jpeg"
+# GSMATERIAL_IMAGE_QUALITY=75
+# GSMATERIAL_IMAGE_MAX_KB=0
+# GSMATERIAL_IMAGE_PROGRESSIVE=True
+# GSMATERIAL_IMAGE_OPTIMIZE=True
+# GSMATERIAL_IMAGE_METHOD=4
+# GSMATERIAL_CALC_PALETTE=True
+IMAGE_FORMAT = str(getattr(_driver.config, "gsmaterial_image_format", "jpeg")).lower()
+IMAGE_QUALITY = min(
+    max(int(getattr(_driver.config, "gsmaterial_image_quality", 75)), 1), 100
+)
+IMAGE_MAX_BYTES = int(
+    float(getattr(_driver.config, "gsmaterial_image_max_kb", 0)) * 1024
+)
+IMAGE_PROGRESSIVE = bool(getattr(_driver.config, "gsmaterial_image_progressive", True))
+IMAGE_OPTIMIZE = bool(getattr(_driver.config, "gsmaterial_image_optimize", True))
+IMAGE_METHOD = min(
+    max(int(getattr(_driver.config, "gsmaterial_image_method", 4)), 0), 6
+)
+CALC_PALETTE = bool(getattr(_driver.config, "gsmaterial_calc_palette", True))
+
+# 同时下载的文件数量
+# GSMATERIAL_DOWNLOAD_CONCURRENCY=8
+DL_CONCURRENCY = max(
+    int(getattr(_driver.config, "gsmaterial_download_concurrency", 8)), 1
+)
+
+# 是否将全部图标预先解码写入图集，绘制时通过 mmap 读取
+# GSMATERIAL_ATLAS=False
+ATLAS = bool(getattr(_driver.config, "gsmaterial_atlas", False))
+
+# 每日推送：每秒发送数量、同时发送数量、失败重试次数
+# GSMATERIAL_PUSH_RATE=1.0
+# GSMATERIAL_PUSH_CONCURRENCY=4
+# GSMATERIAL_PUSH_RETRY=3
+PUSH_RATE = max(float(getattr(_driver.config, "gsmaterial_push_rate", 1.0)), 0.01)
+PUSH_CONCURRENCY = max(
+    int(getattr(_driver.config, "gsmaterial_push_concurrency", 4)), 1
+)
+PUSH_RETRY = max(int(getattr(_driver.config, "gsmaterial_push_retry", 3)), 0)
+
 # 每日材料绘制是否跳过三星物品
 # GSMATERIAL_SKIP_THREE=True
 SKIP_THREE = bool(getattr(_driver.config, "gsmaterial_skip_three", True))
 
+# 绘图任务执行器：并行数、排队上限、是否使用进程池
+# GSMATERIAL_RENDER_WORKERS=2
+# GSMATERIAL_RENDER_QUEUE=16
+# GSMATERIAL_RENDER_PROCESS=False
+RENDER_WORKERS = max(int(getattr(_driver.config, "gsmaterial_render_workers", 2)), 1)
+RENDER_QUEUE = max(int(getattr(_driver.config, "gsmaterial_render_queue", 16)), 1)
+RENDER_PROCESS = bool(getattr(_driver.config, "gsmaterial_render_process", False))
+
+# 上游接口请求：是否启用 HTTP/2、每个上游主机的连接数上限、超时秒数
+# GSMATERIAL_HTTP2=False
+# GSMATERIAL_HTTP_LIMIT=10
+# GSMATERIAL_HTTP_TIMEOUT=10.0
+HTTP2 = bool(getattr(_driver.config, "gsmaterial_http2", False))
+HTTP_LIMIT = max(int(getattr(_driver.config, "gsmaterial_http_limit", 10)), 1)
+HTTP_TIMEOUT = float(getattr(_driver.config, "gsmaterial_http_timeout", 10.0))
+
+# 已生成图片的内存缓存上限，单位 MB
+# GSMATERIAL_CACHE_SIZE=32
+CACHE_SIZE = max(float(getattr(_driver.config, "gsmaterial_cache_size", 32)), 0)
+
+# 材料计算结果缓存有效期秒数及缓存数量上限
+# GSMATERIAL_CALC_TTL=86400
+# GSMATERIAL_CALC_MAX=200
+CALC_TTL = max(int(getattr(_driver.config, "gsmaterial_calc_ttl", 86400)), 0)
+CALC_MAX = max(int(getattr(_driver.config, "gsmaterial_calc_max", 200)), 0)
+
 # 配置缓存路径
 # GSMATERIAL_CONFIG="/path/to/data/gsmaterial"
 _default_dir = Path() / "data" / "gsmaterial"
@@ -97,12 +166,15 @@ if not (CONFIG_DIR / "cookie.json").exists():
         json.dumps({}, ensure_ascii=False, indent=2), encoding="UTF-8"
     )
 
-# 角色别名、武器别名初始化
-_client = Client(verify=False)
-ITEM_ALIAS = _client.get("https://cdn.monsterx.cn/bot/gsmaterial/item-alias.json").json()
-(CONFIG_DIR / "item-alias.json").write_text(
-    json.dumps(ITEM_ALIAS, ensure_ascii=False, indent=2), encoding="utf-8"
-)
+# 角色别名、武器别名初始化，直接读取本地文件，启动后在后台更新
+ALIAS_URL = "https://cdn.monsterx.cn/bot/gsmaterial/item-alias.json"
+try:
+    ITEM_ALIAS = json.loads(
+        (CONFIG_DIR / "item-alias.json").read_text(encoding="utf-8")
+    )
+except (OSError, json.decoder.JSONDecodeError):
+    logger.warning("本地角色、武器别名读取失败，等待后台更新")
+    ITEM_ALIAS = {}
 
 # 素材主键
 WEEKLY_BOSS = [  # 暂时拿第一个作为标识
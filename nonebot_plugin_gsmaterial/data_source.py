@@ -7,101 +7,152 @@ from hashlib import md5
 from pathlib import Path
 from random import randint
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, Union, Literal, Optional
+from typing import Set, Dict, List, Tuple, Union, Literal, Optional
 
 from PIL import Image
-from httpx import HTTPError, AsyncClient
+from httpx import HTTPError
 
 from nonebot.log import logger
 
-from .material_draw import draw_materials, draw_calculator
+from .alias import ALIAS_INDEX
+from .subscribe import SUB_STORE
+from .flight import single_flight
+from .render import RenderQueueFull
+from .model import MATERIALS, MaterialModel
+from .client import get_client, conditional_get
+from .cache import CALC_CACHE, IMAGE_CACHE, CachedImage
+from .assets import DownloadPlan, asset_target, is_valid_asset
+from .material_draw import (
+    draw_panel,
+    build_atlas,
+    merge_panels,
+    material_file,
+    reload_assets,
+    draw_materials,
+    draw_calculator,
+)
 from .config import (
     TZ,
     MYS,
     AMBR,
+    ATLAS,
     DL_CFG,
-    DL_MIRROR,
     CONFIG_DIR,
-    ITEM_ALIAS,
     SKIP_THREE,
     WEEKLY_BOSS,
 )
 
 _WEEKLY_BOSS = WEEKLY_BOSS[:-1]
+AMBR_CACHE_DIR = CONFIG_DIR / "cache" / "ambr"
+SKILL_FILE = CONFIG_DIR / "cache" / "skill.json"
+SKILL_PREFETCH = 4  # 预取角色技能时的并发请求数
+AMBR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 
 async def sub_helper(
-    mode: Literal["r", "ag", "ap", "dg", "dp"] = "r", id: Union[str, int] = ""
+    mode: Literal["r", "ag", "ap", "dg", "dp"] = "r",
+    id: Union[str, int] = "",
+    variant: str = "all",
 ) -> Union[Dict, str]:
     """订阅配置助手，支持读取 ``r(ead)`` 配置、添加 ``a(dd)`` 群组 ``g(roup)`` 订阅、添加私聊 ``p(rivate)`` 订阅、删除 ``d(elete)`` 群组订阅、删除私聊订阅"""
 
-    cfg_file = CONFIG_DIR / "sub.json"
-    sub_cfg = json.loads(cfg_file.read_text(encoding="UTF-8"))
-
     # 读取订阅配置
     if mode == "r":
-        return sub_cfg
+        return SUB_STORE.snapshot()
 
     # 添加及删除订阅配置
     write_key = {"g": "群组", "p": "私聊"}[mode[1]]
-    if mode[0] == "a":
-        # 添加群组订阅或私聊订阅
-        if int(id) in list(sub_cfg[write_key]):
-            return f"已经添加过当前{write_key}的原神每日材料订阅辣！"
-        sub_cfg[write_key].append(int(id))
-    else:
-        # 删除群组订阅或私聊订阅
-        if int(id) not in list(sub_cfg[write_key]):
-            return f"还没有添加过当前{write_key}的原神每日材料订阅哦.."
-        sub_cfg[write_key].remove(int(id))
-
-    # 更新写入
-    cfg_file.write_text(
-        json.dumps(sub_cfg, ensure_ascii=False, indent=2), encoding="UTF-8"
-    )
+    if not await SUB_STORE.update(write_key, int(id), mode[0] == "a", variant):
+        return (
+            f"已经添加过当前{write_key}的原神每日材料订阅辣！"
+            if mode[0] == "a"
+            else f"还没有添加过当前{write_key}的原神每日材料订阅哦.."
+        )
     return f"已{'启用' if mode[0] == 'a' else '禁用'}当前{write_key}的原神每日材料订阅。"
 
 
+class CookieState:
+    """
+    公共 Cookie 有效性状态，避免每次计算前请求米游社校验
+    * ``unknown`` 尚未确认或已过期，直接使用
+    * ``valid`` 最近一次请求成功
+    * ``invalid`` 刷新失败，有效期内直接返回错误
+    """
+
+    def __init__(self, valid_ttl: int, invalid_ttl: int) -> None:
+        self.valid_ttl, self.invalid_ttl = valid_ttl, invalid_ttl
+        self.status: Literal["unknown", "valid", "invalid"] = "unknown"
+        self.error, self.expire, self.generation = "", 0.0, 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def current(self) -> str:
+        """当前状态，超出有效期时回到 ``unknown``"""
+
+        if self.status != "unknown" and time() > self.expire:
+            self.status = "unknown"
+        return self.status
+
+    def mark_valid(self) -> None:
+        self.status, self.error = "valid", ""
+        self.expire = time() + self.valid_ttl
+
+    def mark_invalid(self, error: str) -> None:
+        self.status, self.error = "invalid", error
+        self.expire = time() + self.invalid_ttl
+
+
+COOKIE_KEYS = [
+    "account_id",
+    "account_mid",
+    "account_mid_v2",
+    "cookie_token",
+    "cookie_token_v2",
+    "login_ticket",
+    "login_ticket_v2",
+    "login_uid",
+    "login_uid_v2",
+    "ltmid",
+    "ltmid_v2",
+    "ltoken",
+    "ltoken_v2",
+    "ltuid",
+    "ltuid_v2",
+    "mid",
+    "stmid",
+    "stmid_v2",
+    "stoken",
+    "stoken_v2",
+    "stuid",
+    "stuid_v2",
+]
+
+# 米游社登录失效返回码
+MYS_AUTH_RETCODE = [-100, 10001]
+# 米游社确认角色不存在的返回码：请求成功但没有数据、参数错误
+MYS_NO_AVATAR_RETCODE = [0, -1]
+COOKIE_STATE = CookieState(6 * 3600, 600)
+
+
 async def cookies_helper(cookie: str = "") -> Dict[str, str]:
-    """Cookie 配置助手，支持读取、刷新、写入"""
+    """Cookie 配置助手，支持读取、写入，写入的 Cookie 无效时尝试刷新"""
 
     cookie_file = CONFIG_DIR / "cookie.json"
     cookie_cfg: Dict[str, str] = json.loads(cookie_file.read_text(encoding="UTF-8"))
-    standard_keys = [
-        "account_id",
-        "account_mid",
-        "account_mid_v2",
-        "cookie_token",
-        "cookie_token_v2",
-        "login_ticket",
-        "login_ticket_v2",
-        "login_uid",
-        "login_uid_v2",
-        "ltmid",
-        "ltmid_v2",
-        "ltoken",
-        "ltoken_v2",
-        "ltuid",
-        "ltuid_v2",
-        "mid",
-        "stmid",
-        "stmid_v2",
-        "stoken",
-        "stoken_v2",
-        "stuid",
-        "stuid_v2",
-    ]
 
-    # 读取
+    # 读取，不再逐次校验，登录失效由实际请求发现后再刷新
     if not cookie:
         if not cookie_cfg:
             return {"error": "养成计算器需要米游社 Cookie！"}
-        else:
-            # 蒙德飞行冠军安柏应该不会有人没有吧？
-            check_res = await query_mys("技能", cookie_cfg, {"avatar_id": 10000021})
-            if not check_res.get("error"):
-                # 检验成功才返回，否则尝试刷新
-                return cookie_cfg
+        if COOKIE_STATE.current() == "invalid":
+            # 已确认失效且刷新失败，有效期内直接返回错误
+            return {"error": COOKIE_STATE.error}
+        return cookie_cfg
     # 写入
     else:
         cookie_cfg.update(dict(i.strip().split("=", 1) for i in cookie.split(";")))
@@ -121,15 +172,26 @@ async def cookies_helper(cookie: str = "") -> Dict[str, str]:
                 )
             # 精简 Cookie 字段
             simple_cookie_cfg = {
-                k: cookie_cfg[k] for k in standard_keys if cookie_cfg.get(k)
+                k: cookie_cfg[k] for k in COOKIE_KEYS if cookie_cfg.get(k)
             }
             # 写入更新
             cookie_cfg.update(simple_cookie_cfg)
             cookie_file.write_text(
                 json.dumps(cookie_cfg, ensure_ascii=False, indent=2), encoding="UTF-8"
             )
+            COOKIE_STATE.mark_valid()
             return cookie_cfg
 
+    return await _refresh_cookie(cookie_cfg, cookie)
+
+
+async def _refresh_cookie(
+    cookie_cfg: Dict[str, str], cookie: str = ""
+) -> Dict[str, str]:
+    """通过 login_ticket、stoken 更新 cookie_token 并写入"""
+
+    cookie_file = CONFIG_DIR / "cookie.json"
+
     # 更新米游社用户 ID
     mys_id = (
         cookie_cfg.get("stuid")
@@ -192,7 +254,7 @@ async def cookies_helper(cookie: str = "") -> Dict[str, str]:
         }
 
     # 精简 Cookie 字段
-    simple_cookie_cfg = {k: cookie_cfg[k] for k in standard_keys if cookie_cfg.get(k)}
+    simple_cookie_cfg = {k: cookie_cfg[k] for k in COOKIE_KEYS if cookie_cfg.get(k)}
     # 写入更新
     cookie_cfg.update(simple_cookie_cfg)
     cookie_file.write_text(
@@ -202,22 +264,42 @@ async def cookies_helper(cookie: str = "") -> Dict[str, str]:
     return cookie_cfg
 
 
+async def refresh_cookie(generation: int) -> Dict[str, str]:
+    """登录失效时刷新 Cookie，并发的刷新只执行一次，其余请求等待并复用结果"""
+
+    async with COOKIE_STATE.lock:
+        if COOKIE_STATE.generation != generation:
+            # 等待期间已由其他请求刷新完成
+            return await cookies_helper()
+        cookie_file = CONFIG_DIR / "cookie.json"
+        cookie_cfg = json.loads(cookie_file.read_text(encoding="UTF-8"))
+        refresh_res = await _refresh_cookie(cookie_cfg)
+        COOKIE_STATE.generation += 1
+        if refresh_res.get("error"):
+            COOKIE_STATE.mark_invalid(refresh_res["error"])
+        else:
+            COOKIE_STATE.mark_valid()
+        return refresh_res
+
+
 async def query_ambr(
     type: Literal["每日采集", "升级材料", "角色列表", "武器列表", "材料列表"], retry: int = 3
 ) -> Dict:
-    """安柏计划数据接口请求"""
-
-    async with AsyncClient() as client:
-        while retry:
-            try:
-                res = await client.get(AMBR[type], timeout=10.0)
-                return res.json()["data"]
-            except (HTTPError, json.decoder.JSONDecodeError, KeyError) as e:
-                retry -= 1
-                if retry:
-                    await asyncio.sleep(2)
-                else:
-                    logger.opt(exception=e).error(f"安柏计划 {type} 接口请求出错")
+    """安柏计划数据接口请求，响应缓存至本地并使用条件请求校验"""
+
+    while retry:
+        try:
+            res, changed = await conditional_get(
+                AMBR[type], AMBR_CACHE_DIR / f"{type}.json"
+            )
+            logger.debug(f"安柏计划 {type} 接口{'已更新' if changed else '未变化'}")
+            return res["data"]
+        except (HTTPError, json.decoder.JSONDecodeError, KeyError) as e:
+            retry -= 1
+            if retry:
+                await asyncio.sleep(2)
+            else:
+                logger.opt(exception=e).error(f"安柏计划 {type} 接口请求出错")
     return {}
 
 
@@ -284,33 +366,149 @@ async def query_mys(
         }
     )
 
-    async with AsyncClient() as client:
-        res_dict = {}
-        try:
-            if type != "计算" or type.startswith("_"):
-                res = await client.get(MYS[type], params=data, headers=headers)
-            else:
-                headers["content-type"] = "application/json;charset=UTF-8"
-                res = await client.post(MYS[type], json=data, headers=headers)
-            res_dict = res.json()
-            return res_dict["data"] or {
-                "error": "[{}] {}".format(
-                    res_dict.get("retcode", "null"),
-                    res_dict.get("message", f"米游社{type}接口请求出错！"),
-                )
-            }
-        except (HTTPError, json.decoder.JSONDecodeError, KeyError) as e:
-            logger.opt(exception=e).error(f"米游社 {type} 接口请求出错\n>>>>> {res_dict}")
-            return {
-                "error": "[{}] {}".format(
-                    res_dict.get("retcode", "null"),
-                    res_dict.get("message", f"米游社{type}接口请求出错！"),
-                )
-            }
+    client, res_dict = get_client(MYS[type]), {}
+    try:
+        if type != "计算" or type.startswith("_"):
+            res = await client.get(MYS[type], params=data, headers=headers)
+        else:
+            headers["content-type"] = "application/json;charset=UTF-8"
+            res = await client.post(MYS[type], json=data, headers=headers)
+        res_dict = res.json()
+        return res_dict["data"] or {
+            "error": "[{}] {}".format(
+                res_dict.get("retcode", "null"),
+                res_dict.get("message", f"米游社{type}接口请求出错！"),
+            ),
+            "retcode": res_dict.get("retcode"),
+        }
+    except (HTTPError, json.decoder.JSONDecodeError, KeyError) as e:
+        logger.opt(exception=e).error(f"米游社 {type} 接口请求出错\n>>>>> {res_dict}")
+        return {
+            "error": "[{}] {}".format(
+                res_dict.get("retcode", "null"),
+                res_dict.get("message", f"米游社{type}接口请求出错！"),
+            ),
+            "retcode": res_dict.get("retcode"),
+        }
+
+
+async def query_calculator(type: Literal["技能", "计算"], data: Dict) -> Dict:
+    """使用公共 Cookie 请求米游社计算器，登录失效时刷新 Cookie 并重试一次"""
+
+    generation = COOKIE_STATE.generation
+    cookie_cfg = await cookies_helper()
+    if cookie_cfg.get("error"):
+        return cookie_cfg
+    res = await query_mys(type, cookie_cfg, data)
+    if res.get("retcode") in MYS_AUTH_RETCODE:
+        logger.info(f"米游社 {type} 接口返回登录失效，尝试刷新 Cookie")
+        cookie_cfg = await refresh_cookie(generation)
+        if cookie_cfg.get("error"):
+            return cookie_cfg
+        res = await query_mys(type, cookie_cfg, data)
+        if res.get("retcode") in MYS_AUTH_RETCODE:
+            # 刷新后仍然失效，有效期内不再重复刷新
+            COOKIE_STATE.mark_invalid(res["error"])
+            return res
+    if not res.get("error"):
+        COOKIE_STATE.mark_valid()
+    return res
+
+
+def _load_skills() -> Dict[str, List[int]]:
+    try:
+        return json.loads(SKILL_FILE.read_text(encoding="UTF-8"))
+    except (OSError, json.decoder.JSONDecodeError):
+        return {}
+
+
+# 角色 ID 到可升级技能 ID 的映射，几乎不会变化，首次使用后写入本地
+SKILL_IDS: Dict[str, List[int]] = _load_skills()
+# 米游社明确返回错误的角色，别名中的角色列表变化前不再预取
+_skill_failed: Set[int] = set()
+_skill_failed_key: Tuple[int, ...] = ()
+_prefetch_task: Optional[asyncio.Task] = None
+
+
+def _save_skills() -> None:
+    SKILL_FILE.write_text(
+        json.dumps(SKILL_IDS, ensure_ascii=False, indent=2), encoding="UTF-8"
+    )
+
+
+@single_flight()
+async def _fetch_skill_ids(avatar_id: int) -> Union[List[int], Dict]:
+    """请求米游社角色技能，同一角色并发的计算及预取只请求一次"""
+
+    skill_list = await query_calculator("技能", {"avatar_id": avatar_id})
+    if skill_list.get("error"):
+        # 只记录角色不存在，网络错误、登录失效、频率限制等下次仍会重试
+        if skill_list.get("retcode") in MYS_NO_AVATAR_RETCODE:
+            _skill_failed.add(avatar_id)
+        return skill_list
+    _skill_failed.discard(avatar_id)
+    skill_ids = [
+        skill["group_id"] for skill in skill_list["list"] if skill["max_level"] == 10
+    ]
+    SKILL_IDS[str(avatar_id)] = skill_ids
+    return skill_ids
+
+
+async def get_skill_ids(avatar_id: int) -> Union[List[int], Dict]:
+    """角色可升级技能 ID 获取，本地没有时请求米游社并写入"""
+
+    if str(avatar_id) in SKILL_IDS:
+        return SKILL_IDS[str(avatar_id)]
+    skill_ids = await _fetch_skill_ids(avatar_id)
+    if isinstance(skill_ids, list):
+        _save_skills()
+    return skill_ids
+
+
+async def prefetch_skills() -> None:
+    """预取别名中全部角色的技能 ID，仅请求本地缺少的角色，新版本角色随之补全"""
+
+    global _skill_failed_key
+    avatar_ids = tuple(sorted(i for i in ALIAS_INDEX.ids() if i >= 10000000))
+    if avatar_ids != _skill_failed_key:
+        # 别名更新后新版本角色的数据可能已经可用，失败记录作废
+        _skill_failed.clear()
+        _skill_failed_key = avatar_ids
+    missing = [
+        i for i in avatar_ids if str(i) not in SKILL_IDS and i not in _skill_failed
+    ]
+    if not missing or (await cookies_helper()).get("error"):
+        return
+    logger.info(f"正在预取 {len(missing)} 个角色的技能数据")
+    semaphore = asyncio.Semaphore(SKILL_PREFETCH)
+
+    async def _fetch(avatar_id: int) -> bool:
+        async with semaphore:
+            return isinstance(await _fetch_skill_ids(avatar_id), list)
+
+    fetched = await asyncio.gather(*[_fetch(i) for i in missing])
+    if any(fetched):
+        _save_skills()
+    logger.info(
+        f"角色技能数据预取完成，新增 {sum(fetched)} 个，"
+        f"暂不重试 {len(_skill_failed)} 个"
+    )
+
+
+def start_prefetch_skills() -> None:
+    """在后台预取角色技能数据，不阻塞材料更新，已在预取时不重复启动"""
+
+    global _prefetch_task
+    if _prefetch_task is None or _prefetch_task.done():
+        _prefetch_task = asyncio.create_task(prefetch_skills())
 
 
 async def download(
-    url: str, type: str = "draw", rename: str = "", retry: int = 3
+    url: str,
+    type: str = "draw",
+    rename: str = "",
+    retry: int = 3,
+    check: bool = True,
 ) -> Optional[Path]:
     """
     资源下载。图片资源使用 Pillow 保存
@@ -318,81 +516,71 @@ async def download(
     * ``param type: str = "draw"`` 下载类型，根据类型决定保存的文件夹
     * ``param rename: str = ""`` 下载资源重命名，需要包含文件后缀
     * ``param retry: int = 3`` 下载失败重试次数
+    * ``param check: bool = True`` 是否跳过本地已存在的文件，下载计划已校验时关闭
     - ``return: Optional[Path]`` 本地文件路径，出错时返回空
     """
 
     # 下载链接及保存路径处理
-    if type == "draw":
-        # 插件绘图素材，通过阿里云 CDN 下载
-        f = CONFIG_DIR / "draw" / url
-        url = f"https://cdn.monsterx.cn/bot/gsmaterial/{url}"
-    elif type == "mihoyo":
-        # 通过米游社下载的文件，主要为米游社计算器材料图标
-        f = DL_CFG["item"]["dir"] / rename
-    else:
-        # 可通过镜像下载的文件，主要为角色头像、武器图标、天赋及武器突破材料图标
-        f = DL_CFG[type]["dir"] / rename
-        url = DL_MIRROR + url
+    url, f = asset_target(url, type, rename)
 
     # 跳过下载本地已存在的文件
-    if f.exists():
-        # 测试角色图像为白色问号，该图片 st_size = 5105，小于 6KB 均视为无效图片
-        if not (f.name.lower().endswith("png") and f.stat().st_size < 6144):
-            return f
+    if check and f.exists() and is_valid_asset(f.name, f.stat().st_size):
+        return f
 
     # 远程文件下载
-    async with AsyncClient(verify=False) as client:
-        while retry:
-            try:
-                if type == "draw":
-                    # 通过阿里云 CDN 下载，可能有字体文件等
-                    async with client.stream("GET", url) as res:
-                        with open(f, "wb") as fb:
-                            async for chunk in res.aiter_bytes():
-                                fb.write(chunk)
-                else:
-                    logger.info(f"正在下载文件 {f.name}\n>>>>> {url}")
-                    headers = (
-                        {
-                            "host": "act-webstatic.mihoyo.com",
-                            "referer": "https://webstatic.mihoyo.com/",
-                            "sec-fetch-dest": "image",
-                            "sec-fetch-mode": "no-cors",
-                            "sec-fetch-site": "same-site",
-                            "user-agent": (
-                                "Mozilla/5.0 (Linux; Android 12; SM-G977N Build/SP1A.210812.016; wv) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 "
-                                "Chrome/107.0.5304.105 Mobile Safari/537.36 miHoYoBBS/2.40.1"
-                            ),
-                            "x-requested-with": "com.mihoyo.hyperion",
-                        }
-                        if type == "mihoyo"
-                        else {
-                            "referer": "https://ambr.top/",
-                            "user-agent": (
-                                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, "
-                                "like Gecko) Chrome/104.0.5112.81 Safari/537.36 Edg/104.0.1293.47"
-                            ),
-                        }
-                    )
-                    res = await client.get(url, headers=headers, timeout=20.0)
-                    userImage = Image.open(BytesIO(res.content))
-                    userImage.save(f, quality=100)
-                return f
-            except Exception as e:
-                retry -= 1
-                if retry:
-                    await asyncio.sleep(2)
-                else:
-                    logger.opt(exception=e).error(f"文件 {f.name} 下载失败！")
+    client = get_client(url, verify=False)
+    while retry:
+        try:
+            if type == "draw":
+                # 通过阿里云 CDN 下载，可能有字体文件等
+                async with client.stream("GET", url) as res:
+                    with open(f, "wb") as fb:
+                        async for chunk in res.aiter_bytes():
+                            fb.write(chunk)
+            else:
+                logger.info(f"正在下载文件 {f.name}\n>>>>> {url}")
+                headers = (
+                    {
+                        "host": "act-webstatic.mihoyo.com",
+                        "referer": "https://webstatic.mihoyo.com/",
+                        "sec-fetch-dest": "image",
+                        "sec-fetch-mode": "no-cors",
+                        "sec-fetch-site": "same-site",
+                        "user-agent": (
+                            "Mozilla/5.0 (Linux; Android 12; SM-G977N Build/SP1A.210812.016; wv) "
+                            "AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 "
+                            "Chrome/107.0.5304.105 Mobile Safari/537.36 miHoYoBBS/2.40.1"
+                        ),
+                        "x-requested-with": "com.mihoyo.hyperion",
+                    }
+                    if type == "mihoyo"
+                    else {
+                        "referer": "https://ambr.top/",
+                        "user-agent": (
+                            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, "
+                            "like Gecko) Chrome/104.0.5112.81 Safari/537.36 Edg/104.0.1293.47"
+                        ),
+                    }
+                )
+                res = await client.get(url, headers=headers)
+                userImage = Image.open(BytesIO(res.content))
+                userImage.save(f, quality=100)
+            return f
+        except Exception as e:
+            retry -= 1
+            if retry:
+                await asyncio.sleep(2)
+            else:
+                logger.opt(exception=e).error(f"文件 {f.name} 下载失败！")
 
 
+@single_flight()
 async def update_config() -> None:
     """材料配置更新"""
 
     # 启动资源下载
-    init_tasks = [
-        download(file, "draw")
+    draw_files = [
+        CONFIG_DIR / "draw" / file
         for file in [
             "SmileySans-Oblique.ttf",
             "bg5.140.png",
@@ -400,28 +588,40 @@ async def update_config() -> None:
             "bg3.140.png",
         ]
     ]
+    draw_mtimes = [f.stat().st_mtime_ns if f.exists() else 0 for f in draw_files]
+    init_tasks = [download(f.name, "draw") for f in draw_files]
     await asyncio.gather(*init_tasks)
     init_tasks.clear()
+    # 绘图素材重新下载后，清空已加载的字体及背景图
+    if draw_mtimes != [f.stat().st_mtime_ns if f.exists() else 0 for f in draw_files]:
+        logger.debug("绘图素材已更新，重新加载...")
+        reload_assets()
 
     logger.info("原神材料配置更新开始...")
 
     # 获取安柏计划数据
     logger.debug("安柏计划数据接口请求...")
-    domain_res = await query_ambr("每日采集")
-    update_res = await query_ambr("升级材料")
-    avatar_res = await query_ambr("角色列表")
-    weapon_res = await query_ambr("武器列表")
-    material_res = await query_ambr("材料列表")
+    domain_res, update_res, avatar_res, weapon_res, material_res = await asyncio.gather(
+        query_ambr("每日采集"),
+        query_ambr("升级材料"),
+        query_ambr("角色列表"),
+        query_ambr("武器列表"),
+        query_ambr("材料列表"),
+    )
     if any(
         not x for x in [domain_res, avatar_res, weapon_res, update_res, material_res]
     ):
         logger.info("安柏计划数据不全！更新任务被跳过")
         return
 
-    config = {"avatar": {}, "weapon": {}, "weekly": {}, "skip_3": SKIP_THREE, "time": 0}
+    # 不带后缀的每日材料图片始终不含三星物品，包含三星物品的图片带 .3 后缀
+    config = {"avatar": {}, "weapon": {}, "weekly": {}, "skip_3": True, "time": 0}
+
+    # 所需图片汇总到同一下载计划，去重后一次性下载
+    plan = DownloadPlan(download)
 
     # 生成最新每日材料配置
-    logger.debug("每日材料配置更新 & 对应图片下载...")
+    logger.debug("每日材料配置更新...")
     for weekday, domains in domain_res.items():
         if weekday not in ["monday", "tuesday", "wednesday"]:
             # 跳过材料重复的日期
@@ -457,46 +657,40 @@ async def update_config() -> None:
             config[item_type][day_num][f"{material_name}-{material_id}"] = ",".join(
                 f"{trans[i]['rank']}{trans[i]['name']}{i}" for i in use_this
             )
-            # 下载图片
-            domain_tasks = [
-                download(
-                    f"UI_ItemIcon_{material_id}.png",
-                    "item",
+            # 加入下载计划
+            plan.add(
+                f"UI_ItemIcon_{material_id}.png",
+                "item",
+                "{}.{}".format(
+                    material_id
+                    if DL_CFG["item"]["file"] == "id"
+                    else material_name
+                    if material_name != "？？？"
+                    else material_id,
+                    DL_CFG["item"]["fmt"],
+                ),
+            )
+            for i in use_this:
+                plan.add(
+                    f"{trans[i]['icon']}.png",
+                    item_type,
+                    # 特殊物品图片重命名为 config 中写入格式（L454）
                     "{}.{}".format(
-                        material_id
-                        if DL_CFG["item"]["file"] == "id"
-                        else material_name
-                        if material_name != "？？？"
-                        else material_id,
-                        DL_CFG["item"]["fmt"],
+                        (
+                            i
+                            if DL_CFG[item_type]["file"] == "id"
+                            else trans[i]["name"]
+                            if trans[i]["name"] != "？？？"
+                            else i
+                        )
+                        or f"{trans[i]['rank']}{trans[i]['name']}{i}",
+                        DL_CFG[item_type]["fmt"],
                     ),
-                ),
-                *[
-                    download(
-                        f"{trans[i]['icon']}.png",
-                        item_type,
-                        # 特殊物品图片重命名为 config 中写入格式（L454）
-                        "{}.{}".format(
-                            (
-                                i
-                                if DL_CFG[item_type]["file"] == "id"
-                                else trans[i]["name"]
-                                if trans[i]["name"] != "？？？"
-                                else i
-                            )
-                            or f"{trans[i]['rank']}{trans[i]['name']}{i}",
-                            DL_CFG[item_type]["fmt"],
-                        ),
-                    )
-                    for i in use_this
-                ],
-            ]
-            await asyncio.gather(*domain_tasks)
-            domain_tasks.clear()
+                )
 
     # 获取最新周本材料
-    logger.debug("周本材料配置更新 & 对应图片下载...")
-    weekly_material, weekly_tasks = [], []
+    logger.debug("周本材料配置更新...")
+    weekly_material = []
     for material_id, material in material_res["items"].items():
         # 筛选周本材料
         if (
@@ -518,24 +712,24 @@ async def update_config() -> None:
             continue
         weekly_material.append(material_id)
         if material["icon"]:
-            weekly_tasks.append(
-                download(
-                    f"{material['icon']}.png",
-                    "item",
-                    "{}.{}".format(
-                        material_id
-                        if DL_CFG["item"]["file"] == "id"
-                        else material["name"]
-                        if material["name"] != "？？？"
-                        else material_id,
-                        DL_CFG["item"]["fmt"],
-                    ),
-                )
+            plan.add(
+                f"{material['icon']}.png",
+                "item",
+                "{}.{}".format(
+                    material_id
+                    if DL_CFG["item"]["file"] == "id"
+                    else material["name"]
+                    if material["name"] != "？？？"
+                    else material_id,
+                    DL_CFG["item"]["fmt"],
+                ),
             )
 
-    # 下载最新周本材料图片
-    await asyncio.gather(*weekly_tasks)
-    weekly_tasks.clear()
+    # 下载每日材料、周本材料涉及的全部图片
+    logger.debug("材料图片下载...")
+    await plan.run()
+    if ATLAS:
+        await build_atlas(plan.files())
 
     # 固定已知周本的各个材料键名顺序
     config["weekly"] = {
@@ -576,43 +770,77 @@ async def update_config() -> None:
             avatar_id,
         )
 
-    # 判断是否需要更新缓存
-    config_file, redraw_daily, redraw_weekly = CONFIG_DIR / "config.json", True, True
-    if config_file.exists():
-        old_config: Dict = json.loads(config_file.read_text(encoding="UTF-8"))
-        redraw_daily = any(
-            old_config.get(key) != config[key] for key in ["avatar", "weapon"]
+    # 逐张判断是否需要更新缓存，与内存中的旧配置比较
+    model, old_model = MaterialModel(config), MATERIALS.model
+    # 旧版本生成的图片不区分三星物品策略，可能包含三星物品，全部删除重绘
+    force_daily = old_model.skip_three != model.skip_three
+    if force_daily:
+        for day in [1, 2, 3]:
+            for need in ["avatar", "weapon", "all"]:
+                material_file(need, day, True).unlink(missing_ok=True)
+    daily_panels = [
+        (need, day)
+        for day in [1, 2, 3]
+        for need in ["avatar", "weapon"]
+        if force_daily
+        or old_model.section(need, day) != model.section(need, day)
+        or not material_file(need, day).exists()
+    ]
+    bosses_names = WEEKLY_BOSS if model.beta else _WEEKLY_BOSS
+    bosses_key = [b[0] for b in bosses_names]
+    weekly_panels = [
+        boss
+        for boss in bosses_key
+        if old_model.section(boss) != model.section(boss)
+        or not material_file(boss).exists()
+    ]
+    # 另一种三星物品策略的图片同样过期，删除后在需要时重新绘制
+    for need, day in daily_panels:
+        if old_model.section(need, day) != model.section(need, day):
+            material_file(need, day, not SKIP_THREE).unlink(missing_ok=True)
+            material_file("all", day, not SKIP_THREE).unlink(missing_ok=True)
+    # 只重绘发生变化的单张图片
+    if daily_panels or weekly_panels:
+        logger.debug(f"材料图片缓存生成 {daily_panels} {weekly_panels}")
+        await asyncio.gather(
+            *[
+                draw_panel(model.section(need, day), need, day)
+                for need, day in daily_panels
+            ],
+            *[draw_panel(model.section(boss), boss) for boss in weekly_panels],
         )
-        redraw_weekly = old_config.get("weekly") != config["weekly"]
-        # 跳过三星物品环境变量改变，强制重绘每日材料图片
-        if old_config.get("skip_3", True) != config["skip_3"]:
-            redraw_daily = True
-    # 更新每日材料图片缓存
-    if redraw_daily:
-        logger.debug("每日材料图片缓存生成...")
-        daily_draw_tasks = [
-            draw_materials(config, ["avatar", "weapon"], day) for day in [1, 2, 3]
-        ]
-        await asyncio.gather(*daily_draw_tasks)
-        daily_draw_tasks.clear()
-    # 更新周本材料图片缓存
-    if redraw_weekly:
-        logger.debug("周本材料图片缓存生成...")
-        bosses_names = WEEKLY_BOSS if config["weekly"].get("？？？") else _WEEKLY_BOSS
-        bosses_key = [b[0] for b in bosses_names]
-        await draw_materials(config, bosses_key)
+    # 由缓存的单张图片重新合并总图，不再重绘
+    merge_days = {day for _, day in daily_panels} | {
+        day for day in [1, 2, 3] if not material_file("all", day).exists()
+    }
+    merge_tasks = [merge_panels(["avatar", "weapon"], day) for day in merge_days]
+    if (
+        weekly_panels
+        or list(old_model.weekly) != list(model.weekly)
+        or not material_file("all").exists()
+    ):
+        merge_tasks.append(merge_panels(bosses_key))
+    await asyncio.gather(*merge_tasks)
+    # 任意图片重绘后，内存中的旧图片全部失效
+    if merge_tasks:
+        IMAGE_CACHE.invalidate()
+    merge_tasks.clear()
     # 清理未上线周本过期的图片缓存
-    if not config["weekly"].get("？？？"):
-        beta_weekly_pic = CONFIG_DIR / "cache/weekly.？？？.jpg"
+    if not model.beta:
+        beta_weekly_pic = material_file("？？？")
         beta_weekly_pic.unlink(missing_ok=True)
 
     # 补充时间戳
     config["time"] = int(time())
-    config_file.write_text(
+    (CONFIG_DIR / "config.json").write_text(
         json.dumps(config, ensure_ascii=False, indent=2), encoding="UTF-8"
     )
+    MATERIALS.swap(model)
     logger.info("原神材料配置更新完成！")
 
+    # 后台预取角色技能数据，计算时只需请求一次米游社
+    start_prefetch_skills()
+
 
 def get_weekday(delta: int = 0) -> int:
     """周几整数获取，delta 为向后推迟几天"""
@@ -622,12 +850,14 @@ def get_weekday(delta: int = 0) -> int:
     return (today + timedelta(days=_delta)).weekday() + 1
 
 
+@single_flight()
 async def generate_daily_msg(
     material: Literal["avatar", "weapon", "all", "update"],
     weekday: int = 0,
     delta: int = 0,
-) -> Union[Path, str]:
-    """原神每日材料图片生成入口"""
+    skip_three: bool = SKIP_THREE,
+) -> Union[CachedImage, str]:
+    """原神每日材料图片生成入口，``skip_three`` 为是否跳过三星物品"""
 
     # 时间判断
     weekday = weekday or get_weekday(delta)
@@ -635,43 +865,55 @@ async def generate_daily_msg(
         return "今天所有天赋培养、武器突破材料都可以获取哦~"
     day = weekday % 3 or 3
 
-    # 存在图片缓存且非更新任务时使用缓存
-    cache_pic = CONFIG_DIR / "cache" / f"daily.{day}.{material}.jpg"
-    if material != "update" and cache_pic.exists():
-        logger.info(f"使用缓存的原神材料图片 {cache_pic.name}")
-        return cache_pic
-
-    # 根据每日材料配置重新生成图片
-    config = json.loads((CONFIG_DIR / "config.json").read_text(encoding="UTF-8"))
+    # 存在图片缓存且非更新任务时使用缓存，优先使用内存缓存
+    cache_name = "{}.{}{}".format(
+        day, "all" if material == "update" else material, "" if skip_three else ".3"
+    )
+    if material != "update":
+        cached = IMAGE_CACHE.get("daily", cache_name)
+        if cached:
+            return cached
+        cache_pic = material_file(material, day, skip_three)
+        if cache_pic.exists():
+            logger.info(f"使用缓存的原神材料图片 {cache_pic.name}")
+            return IMAGE_CACHE.put("daily", cache_name, cache_pic.read_bytes())
+
+    # 根据每日材料配置生成图片，更新任务只由缓存的单张图片重新合并总图
     need_types = [material] if material in ["avatar", "weapon"] else ["avatar", "weapon"]
     # 按需绘制素材图片
     try:
-        return await draw_materials(config, need_types, day)
+        draw_res = await draw_materials(MATERIALS.model, need_types, day, skip_three)
+        return IMAGE_CACHE.put("daily", cache_name, draw_res.read_bytes())
     except Exception as e:
         logger.opt(exception=e).error("原神每日材料图片生成出错")
         return f"[{e.__class__.__name__}] 原神每日材料生成失败"
 
 
-async def generate_weekly_msg(boss: str) -> Union[Path, str]:
+@single_flight()
+async def generate_weekly_msg(boss: str) -> Union[CachedImage, str]:
     """原神周本材料图片生成入口"""
 
     assert boss in ["all", *[b[0] for b in WEEKLY_BOSS]]
-    # 存在图片缓存且非更新任务时使用缓存
-    cache_pic = CONFIG_DIR / f"cache/weekly.{boss}.jpg"
+    # 存在图片缓存时使用缓存，优先使用内存缓存
+    cached = IMAGE_CACHE.get("weekly", boss)
+    if cached:
+        return cached
+    cache_pic = material_file(boss)
     if cache_pic.exists():
         logger.info(f"使用缓存的原神材料图片 {cache_pic.name}")
-        return cache_pic
+        return IMAGE_CACHE.put("weekly", boss, cache_pic.read_bytes())
 
     # 根据每日材料配置重新生成图片
-    config = json.loads((CONFIG_DIR / "config.json").read_text(encoding="UTF-8"))
+    model = MATERIALS.model
     need_types = [boss] if boss != "all" else [b[0] for b in _WEEKLY_BOSS]
-    if not config["weekly"].get("？？？") and boss == "？？？":
+    if not model.beta and boss == "？？？":
         return "当前暂无未上线的周本"
-    elif config["weekly"].get("？？？") and boss == "all":
+    elif model.beta and boss == "all":
         need_types.append("？？？")
     # 按需绘制素材图片
     try:
-        return await draw_materials(config, need_types)
+        draw_res = await draw_materials(model, need_types)
+        return IMAGE_CACHE.put("weekly", boss, draw_res.read_bytes())
     except Exception as e:
         logger.opt(exception=e).error("原神周本材料图片生成出错")
         return f"[{e.__class__.__name__}] 原神周本材料生成失败"
@@ -680,16 +922,23 @@ async def generate_weekly_msg(boss: str) -> Union[Path, str]:
 async def get_target(alias: str) -> Tuple[int, str]:
     """升级目标 ID 及真实名称提取"""
 
-    alias = alias.lower()
-    for item_id, item_alias in ITEM_ALIAS.items():
-        if alias in item_alias:
-            return int(item_id), item_alias[0]
-    return 0, alias
+    matched = ALIAS_INDEX.search(alias, 2)
+    if not matched:
+        return 0, alias.lower()
+    top = matched[0]
+    # 精确匹配总是接受；单字前缀、得分并列时无法确定目标，交由调用方给出候选
+    # 前缀匹配及较长名称中的个别错字得分不低于 0.5，短名称的错字仅作为候选
+    if top[2] == 1.0 or (
+        top[2] >= 0.5
+        and len(alias.strip()) > 1
+        and (len(matched) == 1 or matched[1][2] < top[2])
+    ):
+        return top[0], top[1]
+    return 0, alias.lower()
 
 
-async def get_upgrade_target(cookies: Dict[str, str], target_id: int, msg: str) -> Dict:
+async def get_upgrade_target(target_id: int, msg: str) -> Dict:
     """计算器升级范围提取"""
-    # cookie = " ".join(f"{k}={v};" for k, v in cookies.items() if k in ["account_id", "cookie_token"])
 
     lvl_regex = r"([0-9]{1,2})([-\s]([0-9]{1,2}))?"
     t_lvl_regex = r"(10|[1-9])(-(10|[1-9]))?"
@@ -757,12 +1006,9 @@ async def get_upgrade_target(cookies: Dict[str, str], target_id: int, msg: str)
         return {"error": "天赋等级超出限制~"}
 
     # 获取角色技能数据
-    skill_list = await query_mys("技能", cookies, {"avatar_id": target_id})
-    if skill_list.get("error"):
-        return skill_list
-    skill_ids = [
-        skill["group_id"] for skill in skill_list["list"] if skill["max_level"] == 10
-    ]
+    skill_ids = await get_skill_ids(target_id)
+    if isinstance(skill_ids, dict):
+        return skill_ids
 
     return {
         "avatar_id": target_id,
@@ -787,10 +1033,11 @@ async def get_upgrade_target(cookies: Dict[str, str], target_id: int, msg: str)
     }
 
 
-async def generate_calc_msg(msg: str) -> Union[bytes, str]:
+@single_flight(lambda msg: msg.strip())
+async def generate_calc_msg(msg: str) -> Union[CachedImage, str]:
     """原神计算器材料图片生成入口"""
 
-    # 检查 Cookie 中 cookie_token 是否失效并尝试更新
+    # 检查是否配置 Cookie，有效性由实际请求确认
     cookie_dict = await cookies_helper()
     if cookie_dict.get("error"):
         return cookie_dict["error"]
@@ -799,33 +1046,45 @@ async def generate_calc_msg(msg: str) -> Union[bytes, str]:
     target_input = msg.split(" ", 1)[0]
     target_id, target_name = await get_target(target_input.strip())
     if not target_id:
-        return f"无法识别的名称「{target_input}」"
+        suggestions = "、".join(c[1] for c in ALIAS_INDEX.search(target_input, 3))
+        return f"无法识别的名称「{target_input}」" + (
+            f"，你是不是想找：{suggestions}" if suggestions else ""
+        )
     msg = msg.lstrip(target_input).strip()
 
     # 提取升级范围
-    target = await get_upgrade_target(cookie_dict, target_id, msg)
+    target = await get_upgrade_target(target_id, msg)
     if target.get("error"):
         return target["error"]
 
+    # 相同的升级目标直接使用缓存的结果
+    cached = CALC_CACHE.get(target)
+    if cached:
+        logger.info(f"{target_id}: {target} 使用缓存的计算结果")
+        return IMAGE_CACHE.put("calc", CALC_CACHE.key(target), cached[1])
+
     # 请求米游社计算器
     logger.info(f"{target_id}: {target}")
-    calculate = await query_mys("计算", cookie_dict, target)
+    calculate = await query_calculator("计算", target)
     if calculate.get("error"):
         return calculate["error"]
 
-    # 下载计算器素材图片
+    # 下载计算器素材图片，各类消耗中重复的材料只下载一次
+    plan = DownloadPlan(download)
     for key in calculate.keys():
-        consume_tasks = [
-            download(
+        for i in calculate[key]:
+            plan.add(
                 i["icon_url"],
                 "mihoyo",
                 f"{i[DL_CFG['item']['file']]}.{DL_CFG['item']['fmt']}",
             )
-            for i in calculate[key]
-        ]
-        logger.info(f"正在下载计算器 {key} 消耗材料的 {len(consume_tasks)} 张图片")
-        await asyncio.gather(*consume_tasks)
-        consume_tasks.clear()
+    await plan.run()
 
     # 绘制计算器材料图片
-    return await draw_calculator(target_name, target, calculate)
+    try:
+        image = await draw_calculator(target_name, target, calculate)
+    except RenderQueueFull as e:
+        logger.warning(f"原神计算器材料图片绘制被拒绝：{e}")
+        return "当前绘图任务较多，请稍后再试~"
+    CALC_CACHE.put(target, calculate, image)
+    return IMAGE_CACHE.put("calc", CALC_CACHE.key(target), image)
@@ -0,0 +1,79 @@
+from io import BytesIO
+from time import perf_counter
+
+from PIL import Image, features
+
+from nonebot.log import logger
+
+from .config import (
+    IMAGE_METHOD,
+    CALC_PALETTE,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    IMAGE_OPTIMIZE,
+    IMAGE_MAX_BYTES,
+    IMAGE_PROGRESSIVE,
+)
+
+QUANTIZE = getattr(Image, "Quantize", Image).FASTOCTREE
+MIN_QUALITY = 40  # 压缩到体积上限时的最低质量
+
+if IMAGE_FORMAT not in ["jpeg", "jpg", "webp"]:
+    # PNG 仅用于计算器图片，材料图片只能使用 JPEG 或 WebP
+    logger.warning(f"不支持的材料图片格式 {IMAGE_FORMAT}，改用 JPEG 编码")
+    IMAGE_FORMAT = "jpeg"
+elif IMAGE_FORMAT == "jpg":
+    IMAGE_FORMAT = "jpeg"
+elif IMAGE_FORMAT == "webp" and not features.check("webp"):
+    logger.warning("当前 Pillow 不支持 WebP，材料图片改用 JPEG 编码")
+    IMAGE_FORMAT = "jpeg"
+IMAGE_EXT = "webp" if IMAGE_FORMAT == "webp" else "jpg"
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "png":
+        # 计算器卡片颜色单一，量化为调色板 PNG 后体积显著减小
+        if CALC_PALETTE:
+            img = img.quantize(256, method=QUANTIZE)
+        img.save(buf, format="PNG", optimize=True)
+    elif fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=IMAGE_METHOD)
+    else:
+        img.save(
+            buf,
+            format="JPEG",
+            quality=quality,
+            optimize=IMAGE_OPTIMIZE,
+            progressive=IMAGE_PROGRESSIVE,
+        )
+    return buf.getvalue()
+
+
+def encode_image(img: Image.Image, fmt: str = IMAGE_FORMAT, name: str = "") -> bytes:
+    """
+    图片编码，JPEG、WebP 超出体积上限时逐步降低质量
+    * ``param img: Image.Image`` 待编码图片
+    * ``param fmt: str = IMAGE_FORMAT`` 编码格式，``jpeg`` ``webp`` ``png``
+    * ``param name: str = ""`` 日志中显示的图片名称
+    - ``return: bytes`` 编码后的图片
+    """
+
+    start, quality = perf_counter(), IMAGE_QUALITY
+    # 已是 RGB 的图片直接编码，convert 会额外复制一份整图
+    img = img if img.mode == "RGB" else img.convert("RGB")
+    data = _encode(img, fmt, quality)
+    while (
+        fmt != "png"
+        and IMAGE_MAX_BYTES
+        and len(data) > IMAGE_MAX_BYTES
+        and quality > MIN_QUALITY
+    ):
+        quality = max(quality - 10, MIN_QUALITY)
+        data = _encode(img, fmt, quality)
+    logger.debug(
+        f"图片 {name} 编码完成 {fmt.upper()}"
+        f"{'' if fmt == 'png' else f' 质量 {quality}'} "
+        f"{len(data) / 1024:.1f}KB 耗时 {(perf_counter() - start) * 1000:.1f}ms"
+    )
+    return data
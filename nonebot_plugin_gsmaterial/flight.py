@@ -0,0 +1,65 @@
+import asyncio
+from functools import wraps
+from typing import Any, Dict, Tuple, Callable, Hashable, Optional, Awaitable
+
+from nonebot.log import logger
+
+
+class SingleFlight:
+    """
+    按键合并并发的相同任务，执行期间相同键的调用等待并共享同一结果
+    * ``calls`` 实际执行的次数
+    * ``coalesced`` 被合并、未重复执行的调用次数
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各任务的执行及合并次数"""
+
+        return {name: dict(counter) for name, counter in self.counters.items()}
+
+    def wrap(
+        self, key: Optional[Callable[..., Hashable]] = None
+    ) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+        """
+        合并装饰器
+        * ``param key: Callable[..., Hashable] = None`` 由调用参数生成合并键，默认使用全部参数
+        """
+
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            name = func.__name__
+            counter = self.counters.setdefault(name, {"calls": 0, "coalesced": 0})
+
+            # 保留原函数签名，NoneBot2 依赖注入仍可正常识别
+            @wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                flight_key = (
+                    name,
+                    key(*args, **kwargs)
+                    if key
+                    else (args, tuple(sorted(kwargs.items()))),
+                )
+                flight = self._flights.get(flight_key)
+                if flight is not None:
+                    counter["coalesced"] += 1
+                    logger.debug(f"{name} 合并到执行中的相同任务 {flight_key[1]}")
+                else:
+                    counter["calls"] += 1
+                    flight = asyncio.ensure_future(func(*args, **kwargs))
+                    self._flights[flight_key] = flight
+                    flight.add_done_callback(
+                        lambda _: self._flights.pop(flight_key, None)
+                    )
+                # 某个调用方被取消时不影响其余等待同一结果的调用方
+                return await asyncio.shield(flight)
+
+            return wrapper
+
+        return decorator
+
+
+SINGLE_FLIGHT = SingleFlight()
+single_flight = SINGLE_FLIGHT.wrap
@@ -0,0 +1,169 @@
+from math import ceil
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, List, Tuple, Callable, NamedTuple
+
+from PIL import ImageFont
+
+from .model import Item, Section
+from .config import DL_CFG, SKIP_THREE
+
+TITLE_HEIGHT = 150  # 标题区域高度
+GROUP_HEIGHT = 90  # 分组材料图标及名称的高度
+CELL_WIDTH, CELL_HEIGHT = 170 + 10, 160 + 40 + 20  # 每个角色/武器占据的区域
+PER_LINE = 6  # 每行绘制的角色/武器数量
+
+
+class TilePlacement(NamedTuple):
+    """图标方块的放置位置，参数与 ``get_tile`` 一致"""
+
+    kind: str
+    tile_id: str
+    rank: int
+    radius: int
+    size: int
+    icon_path: Path
+    xy: Tuple[int, int]
+    label: str  # 绘制失败时日志中显示的内容
+
+
+class TextPlacement(NamedTuple):
+    """文字的放置位置及样式"""
+
+    xy: Tuple[int, int]
+    text: str
+    size: int
+    fill: str
+    stroke: int = 0
+
+
+class PanelLayout(NamedTuple):
+    """单张材料图片的排版结果，只包含尺寸及坐标，不涉及像素"""
+
+    size: Tuple[int, int]
+    tiles: Tuple[TilePlacement, ...]
+    texts: Tuple[TextPlacement, ...]
+
+
+def _icon_path(kind: str, id: str, name: str) -> Path:
+    return DL_CFG[kind]["dir"] / "{}.{}".format(
+        id if DL_CFG[kind]["file"] == "id" else name, DL_CFG[kind]["fmt"]
+    )
+
+
+@lru_cache(maxsize=64)
+def plan_panel(
+    font: Callable[[int], ImageFont.FreeTypeFont],
+    section: Section,
+    need: str,
+    day: int = 0,
+    skip_three: bool = SKIP_THREE,
+) -> PanelLayout:
+    """
+    原神秘境材料单张图片排版，相同的配置只计算一次
+    * ``param font: Callable[[int], FreeTypeFont]`` 获取指定字号字体，用于测量文字尺寸
+    * ``param section: Section`` ``need`` 当日或周本的材料分组
+    * ``param need: str`` 材料类型 ``avatar`` ``weapon``，或周本名称
+    * ``param day: int = 0`` 星期，为 0 时排版周本 ``need`` 的掉落材料
+    * ``param skip_three: bool = SKIP_THREE`` 是否跳过三星物品
+    - ``return: PanelLayout`` 画布尺寸及全部图标、文字的位置
+    """
+
+    is_weekly = day == 0
+    draw_config: Dict[Tuple[str, str], Tuple[Item, ...]] = {}
+    for group in section:
+        items = tuple(i for i in group.items if not (skip_three and i.rank == 3))
+        if items:  # 剔除 3 星武器
+            draw_config[(group.name, group.id)] = items
+
+    # 计算待绘制图片的宽度
+    title = (
+        need
+        if is_weekly
+        else {1: "周一/周四 {}材料", 2: "周二/周五 {}材料", 3: "周三/周六 {}材料"}[day].format(
+            "天赋培养" if need == "avatar" else "武器突破"
+        )
+    )
+    title_bbox = font(50).getbbox(title)
+    total_width = int(
+        max(
+            title_bbox[-2] + 50,
+            max([font(40).getlength(key[0]) + 150 for key in draw_config]),
+            max([len(items[:PER_LINE]) for items in draw_config.values()]) * CELL_WIDTH
+            + 10,
+        )
+    )
+
+    # 计算待绘制图片的高度，每行绘制 6 个角色或武器
+    line_cnt = sum(ceil(len(items) / PER_LINE) for items in draw_config.values())
+    total_height = (
+        TITLE_HEIGHT + len(draw_config) * GROUP_HEIGHT + line_cnt * CELL_HEIGHT
+    )
+
+    tiles: List[TilePlacement] = []
+    texts = [
+        TextPlacement(
+            (
+                int((total_width - title_bbox[-2]) / 2),
+                int((TITLE_HEIGHT - title_bbox[-1]) / 2),
+            ),
+            title,
+            50,
+            "black",
+            2,
+        )
+    ]
+    group_text_y = int((80 - font(40).getbbox("高")[-1]) / 2)
+    start_h = TITLE_HEIGHT
+    for (key_name, key_id), items in draw_config.items():
+        # 分组所属材料的图标及名称
+        tiles.append(
+            TilePlacement(
+                "item",
+                key_id,
+                4 if need == "avatar" else 5,
+                30,
+                80,
+                _icon_path("item", key_id, key_name if key_name != "？？？" else key_id),
+                (25, start_h),
+                f"{key_name}-{key_id}",
+            )
+        )
+        texts.append(TextPlacement((125, start_h + group_text_y), key_name, 40, "#333"))
+
+        # 当前分组的所有角色/武器，按稀有度从高到低排列
+        start_h += GROUP_HEIGHT
+        kind = "avatar" if need not in ["avatar", "weapon"] else need
+        for idx, item in enumerate(sorted(items, key=lambda x: x.rank, reverse=True)):
+            rank, name, this_id = item
+            draw_x = 10 + (idx % PER_LINE) * CELL_WIDTH
+            draw_y = start_h + (idx // PER_LINE) * CELL_HEIGHT
+            tiles.append(
+                TilePlacement(
+                    kind,
+                    this_id,
+                    rank,
+                    10,
+                    150,
+                    _icon_path(kind, this_id, name),
+                    (draw_x + 10, draw_y + 10),
+                    name,
+                )
+            )
+            name_bbox = font(30).getbbox(name)
+            texts.append(
+                TextPlacement(
+                    (
+                        int(draw_x + (170 - name_bbox[-2]) / 2),
+                        int(draw_y + 160 + (40 - name_bbox[-1]) / 2),
+                    ),
+                    name,
+                    30,
+                    "#333",
+                )
+            )
+
+        # 一组角色/武器排版完毕
+        start_h += CELL_HEIGHT * ceil(len(items) / PER_LINE)
+
+    return PanelLayout((total_width, total_height), tuple(tiles), tuple(texts))
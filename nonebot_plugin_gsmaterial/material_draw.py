@@ -1,234 +1,312 @@
-from re import match
-from math import ceil
-from io import BytesIO
+import os
+import asyncio
 from pathlib import Path
-from copy import deepcopy
-from typing import Dict, List, Union
+from threading import Lock
+from math import ceil, hypot
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Iterator, Optional
 
 from PIL import Image, ImageDraw, ImageFont
 
 from nonebot.log import logger
-from nonebot.utils import run_sync
 
-from .config import DL_CFG, CONFIG_DIR, SKIP_THREE
+from .render import render_executor
+from .atlas import ICON_SIZE, IconAtlas
+from .model import Section, MaterialModel
+from .layout import PanelLayout, plan_panel
+from .encoder import IMAGE_EXT, encode_image
+from .config import ATLAS, DL_CFG, CONFIG_DIR, SKIP_THREE
 
 RESAMPLING = getattr(Image, "Resampling", Image).LANCZOS
+TRANSPOSE = getattr(Image, "Transpose", Image)
+TILE_DIR = CONFIG_DIR / "cache" / "tile"
+TILE_DIR.mkdir(parents=True, exist_ok=True)
+TILE_LRU_SIZE = 512
+_tile_lru: "OrderedDict[Tuple, Tuple[int, Image.Image]]" = OrderedDict()
+_tile_lock = Lock()
+ICON_ATLAS = IconAtlas(CONFIG_DIR / "cache")
+
+
+class AssetRegistry:
+    """绘图素材注册表，字体按字号、背景图按文件名只加载一次并在进程内共享，不可修改"""
+
+    def __init__(self, draw_dir: Path) -> None:
+        self.draw_dir = draw_dir
+        self._fonts: Dict[int, ImageFont.FreeTypeFont] = {}
+        self._sprites: Dict[str, Image.Image] = {}
+        self._lock = Lock()
+
+    def font(self, size: int) -> ImageFont.FreeTypeFont:
+        """指定字号的绘制字体"""
+
+        if size not in self._fonts:
+            with self._lock:
+                if size not in self._fonts:
+                    self._fonts[size] = ImageFont.truetype(
+                        str(self.draw_dir / "SmileySans-Oblique.ttf"), size=size
+                    )  # HYWH-65W
+        return self._fonts[size]
+
+    def sprite(self, name: str) -> Image.Image:
+        """已解码的背景图片，使用前需要复制"""
+
+        if name not in self._sprites:
+            with self._lock:
+                if name not in self._sprites:
+                    self._sprites[name] = Image.open(self.draw_dir / name).convert(
+                        "RGBA"
+                    )
+        return self._sprites[name]
+
+    def reload(self) -> None:
+        """清空已加载的素材，下次使用时从磁盘重新加载"""
+
+        with self._lock:
+            self._fonts.clear()
+            self._sprites.clear()
+
+
+ASSETS = AssetRegistry(CONFIG_DIR / "draw")
 
 
 def font(size: int) -> ImageFont.FreeTypeFont:
     """Pillow 绘制字体设置"""
 
-    return ImageFont.truetype(
-        str(CONFIG_DIR / "draw" / "SmileySans-Oblique.ttf"), size=size  # HYWH-65W
+    return ASSETS.font(size)
+
+
+def reload_assets() -> None:
+    """绘图素材重新下载后调用，清空素材及图标方块缓存"""
+
+    ASSETS.reload()
+    # 字体可能变化，排版结果需要重新计算
+    plan_panel.cache_clear()
+    with _tile_lock:
+        _tile_lru.clear()
+    for tile_file in TILE_DIR.glob("*.png"):
+        tile_file.unlink(missing_ok=True)
+    # 进程池中的子进程各自持有旧素材，需要重建
+    render_executor.recycle()
+
+
+@lru_cache(maxsize=32)
+def corner_mask(width: int, height: int, radius: int) -> Image.Image:
+    """按尺寸及圆角半径生成抗锯齿圆角蒙版，每种尺寸只计算一次"""
+
+    radius = max(0, min(radius, width // 2, height // 2))
+    # 以像素中心到圆心的距离估算覆盖率，在原始分辨率下完成抗锯齿
+    corner = Image.new("L", (radius, radius), 0)
+    corner.putdata(
+        [
+            round(
+                255
+                * min(
+                    max(radius + 0.5 - hypot(radius - x - 0.5, radius - y - 0.5), 0),
+                    1,
+                )
+            )
+            for y in range(radius)
+            for x in range(radius)
+        ]
+    )
+    mask = Image.new("L", (width, height), 255)
+    mask.paste(corner, (0, 0))
+    mask.paste(corner.transpose(TRANSPOSE.FLIP_LEFT_RIGHT), (width - radius, 0))
+    mask.paste(corner.transpose(TRANSPOSE.FLIP_TOP_BOTTOM), (0, height - radius))
+    mask.paste(
+        corner.transpose(TRANSPOSE.ROTATE_180), (width - radius, height - radius)
     )
+    return mask
 
 
-@run_sync
 def circle_corner(mark_img: Image.Image, radius: int = 30) -> Image.Image:
     """图片圆角处理"""
 
     mark_img = mark_img.convert("RGBA")
-    scale, radius = 5, radius * 5
-    mark_img = mark_img.resize(
-        (mark_img.size[0] * scale, mark_img.size[1] * scale), RESAMPLING
+    mark_img.putalpha(corner_mask(*mark_img.size, radius))
+    return mark_img
+
+
+def _load_icon(icon_path: Path) -> Image.Image:
+    return (
+        Image.open(icon_path)
+        .resize((ICON_SIZE, ICON_SIZE), RESAMPLING)
+        .convert("RGBA")
     )
-    w, h = mark_img.size
-    circle = Image.new("L", (radius * 2, radius * 2), 0)
-    draw = ImageDraw.Draw(circle)
-    draw.ellipse((0, 0, radius * 2, radius * 2), fill=255)
-    alpha = Image.new("L", mark_img.size, 255)
-    alpha.paste(circle.crop((0, 0, radius, radius)), (0, 0))
-    alpha.paste(circle.crop((radius, 0, radius * 2, radius)), (w - radius, 0))
-    alpha.paste(
-        circle.crop((radius, radius, radius * 2, radius * 2)),
-        (w - radius, h - radius),
+
+
+def _build_tile(
+    icon_path: Path, rank: int, radius: int, size: int, src_mtime: int = 0
+) -> Image.Image:
+    """
+    图标叠加稀有度背景后圆角处理并缩放，启用图集时优先从图集读取图标
+    * 只在图标方块的内存、磁盘缓存均未命中时调用，图集仅在方块缓存为空时起作用
+    """
+
+    tile = (
+        ASSETS.sprite(f"bg{rank}.140.png").copy()
+        if rank
+        else Image.new("RGBA", (140, 140), "#818486")
     )
-    alpha.paste(circle.crop((0, radius, radius, radius * 2)), (0, h - radius))
-    mark_img.putalpha(alpha)
-    return mark_img.resize((int(w / scale), int(h / scale)), RESAMPLING)
-
-
-async def draw_materials(config: Dict, needs: List[str], day: int = 0) -> Path:
-    """原神秘境材料图片绘制"""
-
-    cache_dir = CONFIG_DIR / "cache"
-    is_weekly, img_and_path = day == 0, []
-    rank_bg = {
-        "3": Image.open(CONFIG_DIR / "draw/bg3.140.png"),
-        "4": Image.open(CONFIG_DIR / "draw/bg4.140.png"),
-        "5": Image.open(CONFIG_DIR / "draw/bg5.140.png"),
-    }
-    for need in needs:
-        raw_config = config["weekly" if is_weekly else need][
-            need if is_weekly else str(day)
-        ]
-        draw_config = {  # 剔除 3 星武器
-            key: ",".join(s for s in value.split(",") if not SKIP_THREE or s[0] != "3")
-            for key, value in dict(raw_config).items()
-            if value
-        }
-
-        # 计算待绘制图片的宽度
-        title = (
-            need
-            if is_weekly
-            else {1: "周一/周四 {}材料", 2: "周二/周五 {}材料", 3: "周三/周六 {}材料"}[day].format(
-                "天赋培养" if need == "avatar" else "武器突破"
-            )
-        )
-        title_bbox = font(50).getbbox(title)
-        total_width = max(
-            title_bbox[-2] + 50,
-            max(
-                [(font(40).getlength(_key.split("-")[0]) + 150) for _key in draw_config]
-            ),
-            max([len(draw_config[_key].split(",")[:6]) for _key in draw_config])
-            * (170 + 10)
-            + 10,
-        )
+    icon = ICON_ATLAS.icon(icon_path, src_mtime) if ATLAS else None
+    if icon is None:
+        icon = _load_icon(icon_path)
+    tile.paste(icon, (0, 0), icon)
+    return circle_corner(tile, radius=radius).resize((size, size), RESAMPLING)
+
+
+def get_tile(
+    kind: str, tile_id: str, rank: int, radius: int, size: int, icon_path: Path
+) -> Image.Image:
+    """
+    图标方块获取，依次使用内存缓存、磁盘缓存，均未命中时重新绘制
+    * ``param kind: str`` 图标类型，``avatar`` ``weapon`` ``item``
+    * ``param tile_id: str`` 图标 ID
+    * ``param rank: int`` 稀有度，为 0 时使用灰色背景
+    * ``param radius: int`` 圆角半径
+    * ``param size: int`` 最终边长
+    * ``param icon_path: Path`` 源图标路径，其修改时间变化时缓存失效
+    - ``return: Image.Image`` 共享的方块图片，不可修改
+    """
+
+    key = (kind, tile_id, rank, radius, size)
+    src_mtime = icon_path.stat().st_mtime_ns
+    with _tile_lock:
+        cached = _tile_lru.get(key)
+        if cached and cached[0] == src_mtime:
+            _tile_lru.move_to_end(key)
+            return cached[1]
+
+    # 磁盘缓存的修改时间与源图标保持一致，不一致即视为过期
+    tile_file = TILE_DIR / "{}.{}.{}.{}.{}.png".format(*key)
+    if tile_file.exists() and tile_file.stat().st_mtime_ns == src_mtime:
+        tile = Image.open(tile_file)
+        tile.load()
+    else:
+        tile = _build_tile(icon_path, rank, radius, size, src_mtime)
+        tile.save(tile_file)
+        os.utime(tile_file, ns=(src_mtime, src_mtime))
+
+    with _tile_lock:
+        _tile_lru[key] = (src_mtime, tile)
+        _tile_lru.move_to_end(key)
+        while len(_tile_lru) > TILE_LRU_SIZE:
+            _tile_lru.popitem(last=False)
+    return tile
+
+
+def _icon_pixels(
+    icon_paths: List[Path],
+) -> Iterator[Tuple[Path, int, Optional[bytes]]]:
+    for icon_path in icon_paths:
+        try:
+            src_mtime = icon_path.stat().st_mtime_ns
+        except OSError:
+            # 下载失败的图标不写入图集
+            continue
+        try:
+            data: Optional[bytes] = _load_icon(icon_path).tobytes()
+        except OSError:
+            # 无法识别的图标只记录修改时间，绘制时直接读取
+            data = None
+        yield icon_path, src_mtime, data
 
-        # 计算待绘制图片的高度，每行绘制 6 个角色或武器
-        line_cnt = sum(
-            ceil(len(draw_config[_key].split(",")) / 6) for _key in draw_config
-        )
-        total_height = 150 + len(draw_config) * 90 + line_cnt * (160 + 40 + 20)
 
-        # 开始绘制！
-        img = Image.new("RGBA", (int(total_width), total_height), "#FBFBFB")
-        drawer = ImageDraw.Draw(img)
+def _build_atlas(icon_paths: List[Path]) -> int:
+    return ICON_ATLAS.write(_icon_pixels(icon_paths))
 
-        # 绘制标题
-        drawer.text(
-            (int((total_width - title_bbox[-2]) / 2), int((150 - title_bbox[-1]) / 2)),
-            title,
-            fill="black",
-            font=font(50),
-            stroke_fill="grey",
-            stroke_width=2,
-        )
 
-        # 绘制每个分组
-        startH = 150
-        for key in draw_config:
-            # 绘制分组所属材料的图片
-            key_name, key_id = key.split("-")
-            try:
-                _key_icon = deepcopy(rank_bg["4" if need == "avatar" else "5"])
-                _key_icon_path = DL_CFG["item"]["dir"] / "{}.{}".format(
-                    key_id
-                    if DL_CFG["item"]["file"] == "id"
-                    else key_name
-                    if key_name != "？？？"
-                    else key_id,
-                    DL_CFG["item"]["fmt"],
-                )
-                _key_icon_img = (
-                    Image.open(_key_icon_path)
-                    .resize((140, 140), RESAMPLING)
-                    .convert("RGBA")
-                )
-                _key_icon.paste(_key_icon_img, (0, 0), _key_icon_img)
-                _key_icon = (await circle_corner(_key_icon, radius=30)).resize(
-                    (80, 80), RESAMPLING
-                )
-                img.paste(_key_icon, (25, startH), _key_icon)
-            except Exception as e:
-                logger.opt(exception=e).error(key)
-                pass
-            # 绘制分组所属材料的名称
-            ImageDraw.Draw(img).text(
-                (125, startH + int((80 - font(40).getbbox("高")[-1]) / 2)),
-                key_name,
-                font=font(40),
-                fill="#333",
-            )
+async def build_atlas(icon_paths: List[Path]) -> None:
+    """图集缺少图标或图标已更新时重新生成图集"""
 
-            # 绘制当前分组的所有角色/武器
-            startH += 90
-            draw_X, draw_Y, cnt = 10, startH, 0
-            draw_order = sorted(
-                draw_config[key].split(","), key=lambda x: x[0], reverse=True
-            )
-            for item in draw_order:
-                if match(r"^[0-9][\u3000-\u9fff]+[0-9]{5,}$", item):
-                    # 5雷电将军10000052,5八重神子10000058,...
-                    _split = -5 if need == "weapon" else -8
-                    rank, name, this_id = item[0], item[1:_split], item[_split:]
-                else:
-                    rank = 0
-                    name = this_id = item
-                # 角色/武器图片
-                try:
-                    _dl_cfg_key = "avatar" if need not in ["avatar", "weapon"] else need
-                    _icon = (
-                        deepcopy(rank_bg[str(rank)])
-                        if rank
-                        else Image.new("RGBA", (140, 140), "#818486")
-                    )
-                    _icon_path = DL_CFG[_dl_cfg_key]["dir"] / "{}.{}".format(
-                        this_id if DL_CFG[_dl_cfg_key]["file"] == "id" else name,
-                        DL_CFG[_dl_cfg_key]["fmt"],
-                    )
-                    _icon_img = (
-                        Image.open(_icon_path)
-                        .resize((140, 140), RESAMPLING)
-                        .convert("RGBA")
-                    )
-                    _icon.paste(_icon_img, (0, 0), _icon_img)
-                    _icon = (await circle_corner(_icon, radius=10)).resize(
-                        (150, 150), RESAMPLING  # 140
-                    )
-                    img.paste(_icon, (draw_X + 10, draw_Y + 10), _icon)
-                except Exception as e:
-                    logger.opt(exception=e).error(item)
-                    pass
-                # 角色/武器名称
-                name_bbox = font(30).getbbox(name)
-                ImageDraw.Draw(img).text(
-                    (
-                        int(draw_X + (170 - name_bbox[-2]) / 2),
-                        int(draw_Y + 160 + (40 - name_bbox[-1]) / 2),
-                    ),
-                    name,
-                    font=font(30),
-                    fill="#333",
-                )
-                # 按照 6 个角色/武器一行绘制
-                draw_X += 170 + 10
-                cnt += 1
-                if cnt == 6:
-                    draw_X, cnt = 10, 0
-                    draw_Y += 160 + 40 + 20
-
-            # 一组角色/武器绘制完毕
-            startH += (160 + 40 + 20) * ceil(len(draw_config[key].split(",")) / 6)
-
-        # 全部绘制完毕，保存图片
-        cache_file = cache_dir / (
-            f"weekly.{need}.jpg" if is_weekly else f"daily.{day}.{need}.jpg"
+    if ICON_ATLAS.covers(icon_paths):
+        return
+    count = await render_executor.submit(_build_atlas, icon_paths, block=True)
+    ICON_ATLAS.load()
+    # 进程池中的子进程各自持有旧映射，需要重建
+    render_executor.recycle()
+    logger.info(f"图标图集生成完毕，共 {count} 个图标")
+
+
+def material_file(need: str, day: int = 0, skip_three: bool = SKIP_THREE) -> Path:
+    """
+    秘境材料图片缓存路径，``need`` 为 ``all`` 时为合并后的总图
+    * 每日材料包含三星物品时文件名带 ``.3`` 后缀，两种图片分别缓存
+    """
+
+    if day == 0:
+        file_name = f"weekly.{need}.{IMAGE_EXT}"
+    else:
+        file_name = f"daily.{day}.{need}{'' if skip_three else '.3'}.{IMAGE_EXT}"
+    return CONFIG_DIR / "cache" / file_name
+
+
+def _rasterize(layout: PanelLayout) -> Image.Image:
+    """按排版结果绘制图片，图标缺失时跳过该图标"""
+
+    img = Image.new("RGB", layout.size, "#FBFBFB")
+    for tile in layout.tiles:
+        try:
+            _icon = get_tile(*tile[:6])
+            img.paste(_icon, tile.xy, _icon)
+        except Exception as e:
+            logger.opt(exception=e).error(tile.label)
+    drawer = ImageDraw.Draw(img)
+    for text in layout.texts:
+        drawer.text(
+            text.xy,
+            text.text,
+            fill=text.fill,
+            font=font(text.size),
+            stroke_fill="grey" if text.stroke else None,
+            stroke_width=text.stroke,
         )
-        img.convert("RGB").save(cache_file)
-        logger.debug(f"{'周本' if is_weekly else '每日'}材料图片生成完毕 {cache_file.name}")
-        img_and_path.append([img, cache_file])
-
-    # 仅有一张图片时直接返回
-    if len(img_and_path) == 1:
-        return img_and_path[0][1]
-
-    # 存在多张图片时横向合并
-    width = sum([i[0].size[0] for i in img_and_path]) + (len(img_and_path) - 1) * 25
-    _weight, height = 0, max([i[0].size[1] for i in img_and_path])
-    merge = Image.new("RGBA", (width, height), "#FBFBFB")
-    for i in img_and_path:
-        merge.paste(i[0], (_weight, 0), i[0])
-        _weight += i[0].size[0] + 25
-    merge_file = cache_dir / ("weekly.all.jpg" if is_weekly else f"daily.{day}.all.jpg")
-    merge.convert("RGB").save(merge_file)
+    return img
+
+
+def _draw_panel(
+    section: Section, need: str, day: int = 0, skip_three: bool = SKIP_THREE
+) -> Path:
+    """原神秘境材料单张图片绘制，``day`` 为 0 时绘制周本 ``need`` 的掉落材料"""
+
+    is_weekly = day == 0
+    img = _rasterize(plan_panel(font, section, need, day, skip_three))
+
+    # 全部绘制完毕，保存图片
+    cache_file = material_file(need, day, skip_three)
+    cache_file.write_bytes(encode_image(img, name=cache_file.name))
+    logger.debug(f"{'周本' if is_weekly else '每日'}材料图片生成完毕 {cache_file.name}")
+    return cache_file
+
+
+def _merge_panels(
+    needs: List[str], day: int = 0, skip_three: bool = SKIP_THREE
+) -> Path:
+    """
+    从已缓存的单张图片横向合并总图，不重新绘制
+    * 先只读取文件头确定尺寸，再逐张解码、粘贴到 RGB 画布后立即释放
+    """
+
+    is_weekly, files = day == 0, [material_file(n, day, skip_three) for n in needs]
+    sizes = []
+    for f in files:
+        with Image.open(f) as panel:
+            sizes.append(panel.size)
+    width = sum([i[0] for i in sizes]) + (len(sizes) - 1) * 25
+    _weight, height = 0, max([i[1] for i in sizes])
+    merge = Image.new("RGB", (width, height), "#FBFBFB")
+    for f, size in zip(files, sizes):
+        with Image.open(f) as panel:
+            merge.paste(panel, (_weight, 0))
+        _weight += size[0] + 25
+    merge_file = material_file("all", day, skip_three)
+    merge_file.write_bytes(encode_image(merge, name=merge_file.name))
     logger.info(f"{'周本' if is_weekly else '每日'}材料图片合并完毕 {merge_file.name}")
     return merge_file
 
 
-async def draw_calculator(name: str, target: Dict, calculate: Dict) -> Union[bytes, str]:
+def _draw_calculator(name: str, target: Dict, calculate: Dict) -> bytes:
     """原神计算器材料图片绘制"""
     height = sum(80 + ceil(len(v) / 2) * 70 + 20 for _, v in calculate.items() if v) + 20
     img = Image.new("RGBA", (800, height), "#FEFEFE")
@@ -318,6 +396,53 @@ async def draw_calculator(name: str, target: Dict, calculate: Dict) -> Union[byt
 
         draw_Y += block_height + 20
 
-    buf = BytesIO()
-    img.save(buf, format="PNG", quality=100)
-    return buf.getvalue()
+    return encode_image(img, "png", f"{name}·计算器")
+
+
+async def draw_panel(
+    section: Section, need: str, day: int = 0, skip_three: bool = SKIP_THREE
+) -> Path:
+    """原神秘境材料单张图片绘制，在绘图任务执行器中运行，排队已满时等待"""
+
+    return await render_executor.submit(
+        _draw_panel, section, need, day, skip_three, block=True
+    )
+
+
+async def merge_panels(
+    needs: List[str], day: int = 0, skip_three: bool = SKIP_THREE
+) -> Path:
+    """原神秘境材料总图合并，在绘图任务执行器中运行，排队已满时等待"""
+
+    return await render_executor.submit(
+        _merge_panels, needs, day, skip_three, block=True
+    )
+
+
+async def draw_materials(
+    model: MaterialModel,
+    needs: List[str],
+    day: int = 0,
+    skip_three: bool = SKIP_THREE,
+) -> Path:
+    """
+    原神秘境材料图片绘制，存在多张图片时合并为总图
+    * 只绘制尚未缓存的单张图片，已缓存的单张图片直接用于合并
+    """
+
+    await asyncio.gather(
+        *[
+            draw_panel(model.section(need, day), need, day, skip_three)
+            for need in needs
+            if not material_file(need, day, skip_three).exists()
+        ]
+    )
+    if len(needs) == 1:
+        return material_file(needs[0], day, skip_three)
+    return await merge_panels(needs, day, skip_three)
+
+
+async def draw_calculator(name: str, target: Dict, calculate: Dict) -> bytes:
+    """原神计算器材料图片绘制，在绘图任务执行器中运行"""
+
+    return await render_executor.submit(_draw_calculator, name, target, calculate)
@@ -0,0 +1,101 @@
+import json
+from re import match
+from pathlib import Path
+from typing import Dict, Tuple, NamedTuple, Optional
+
+from .config import CONFIG_DIR
+
+
+class Item(NamedTuple):
+    """角色或武器，``rank`` 为 0 时表示无法识别的条目"""
+
+    rank: int
+    name: str
+    id: str
+
+
+class MaterialGroup(NamedTuple):
+    """一种材料及使用它的全部角色或武器"""
+
+    name: str
+    id: str
+    items: Tuple[Item, ...]
+
+
+Section = Tuple[MaterialGroup, ...]
+
+
+def _parse_item(item: str, id_len: int) -> Item:
+    if match(r"^[0-9][\u3000-\u9fff]+[0-9]{5,}$", item):
+        # 5雷电将军10000052,5八重神子10000058,...
+        return Item(int(item[0]), item[1:-id_len], item[-id_len:])
+    return Item(0, item, item)
+
+
+def _parse_section(groups: Dict[str, str], id_len: int) -> Section:
+    return tuple(
+        MaterialGroup(
+            *key.rsplit("-", 1),
+            tuple(_parse_item(i, id_len) for i in value.split(",") if i),
+        )
+        for key, value in groups.items()
+    )
+
+
+class MaterialModel:
+    """
+    ``config.json`` 的内存模型，逗号拼接的配置只在载入时解析一次
+    * ``daily`` 以 ``(need, day)`` 为键的每日材料分组
+    * ``weekly`` 以周本名称为键的周本材料分组，保持配置中的顺序
+    """
+
+    __slots__ = ("daily", "weekly", "skip_three")
+
+    def __init__(self, config: Dict) -> None:
+        self.daily: Dict[Tuple[str, int], Section] = {
+            (need, int(day)): _parse_section(groups, 5 if need == "weapon" else 8)
+            for need in ["avatar", "weapon"]
+            for day, groups in config.get(need, {}).items()
+        }
+        self.weekly: Dict[str, Section] = {
+            boss: _parse_section(groups, 8)
+            for boss, groups in config.get("weekly", {}).items()
+        }
+        self.skip_three: bool = config.get("skip_3", True)
+
+    def section(self, need: str, day: int = 0) -> Section:
+        """``day`` 为 0 时返回周本 ``need`` 的分组，不存在时返回空"""
+
+        if day == 0:
+            return self.weekly.get(need, ())
+        return self.daily.get((need, day), ())
+
+    @property
+    def beta(self) -> bool:
+        """是否存在未上线的周本"""
+
+        return bool(self.weekly.get("？？？"))
+
+
+class MaterialStore:
+    """材料模型持有者，首次使用时读取 ``config.json``，更新后整体替换"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._model: Optional[MaterialModel] = None
+
+    @property
+    def model(self) -> MaterialModel:
+        if self._model is None:
+            try:
+                config = json.loads(self.path.read_text(encoding="UTF-8"))
+            except (OSError, json.decoder.JSONDecodeError):
+                config = {}
+            self._model = MaterialModel(config)
+        return self._model
+
+    def swap(self, model: MaterialModel) -> None:
+        self._model = model
+
+
+MATERIALS = MaterialStore(CONFIG_DIR / "config.json")
@@ -0,0 +1,218 @@
+import os
+import json
+import asyncio
+from pathlib import Path
+from time import monotonic
+from random import uniform
+from datetime import datetime
+from typing import Set, Dict, List, Callable, Iterable, Optional, Awaitable
+
+from nonebot.log import logger
+
+from .config import TZ, CONFIG_DIR, PUSH_RATE, PUSH_RETRY, PUSH_CONCURRENCY
+
+
+class TokenBucket:
+    """
+    令牌桶限速
+    * ``param rate: float`` 每秒补充的令牌数量
+    * ``param burst: int`` 令牌桶容量，即允许瞬间发出的数量
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = float(burst), monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        """等待并取走一个令牌"""
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PushProgress:
+    """
+    每日推送进度，每完成一个推送目标写入一次磁盘，重启后继续未完成的推送
+    * ``date`` 推送日期，日期变化后旧进度作废
+    * ``done`` 已推送成功的目标
+    * ``failed`` 重试后仍失败的目标
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        try:
+            self._data: Dict = json.loads(path.read_text(encoding="UTF-8"))
+        except (OSError, json.decoder.JSONDecodeError):
+            self._data = {}
+
+    @staticmethod
+    def today() -> str:
+        return datetime.now(TZ).strftime("%Y-%m-%d")
+
+    def unfinished(self) -> bool:
+        """今日是否有中断的推送"""
+
+        return self._data.get("date") == self.today() and not self._data.get(
+            "finished", True
+        )
+
+    def start(self, targets: List[str]) -> List[str]:
+        """
+        开始推送，今日推送中断过时保留已完成的目标，今日已推送完毕时不再推送
+        - ``return: List[str]`` 尚未推送的目标
+        """
+
+        if self._data.get("date") == self.today() and self._data.get("finished"):
+            return []
+        if not self.unfinished():
+            self._data = {"date": self.today(), "done": [], "failed": []}
+        self._data["finished"] = False
+        self._data["failed"] = []
+        self.save()
+        done = set(self._data["done"])
+        return [t for t in targets if t not in done]
+
+    def mark(self, target: str, success: bool) -> None:
+        self._data["done" if success else "failed"].append(target)
+        self.save()
+
+    def finish(self, left: int = 0) -> Dict[str, int]:
+        """结束推送，``left`` 为没有 Bot 可用而未推送的数量，不为 0 时视为中断"""
+
+        self._data["finished"] = not left
+        self.save()
+        return {
+            "done": len(self._data["done"]),
+            "failed": len(self._data["failed"]),
+            "left": left,
+        }
+
+    def save(self) -> None:
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        tmp.write_text(json.dumps(self._data, ensure_ascii=False), encoding="UTF-8")
+        os.replace(tmp, self.path)
+
+
+class BotShards:
+    """
+    多 Bot 分片推送，每个目标分配给能触达它的在线 Bot 中已分配最少的一个
+    * ``param reach: Dict[str, Set[str]]`` 各 Bot 可触达的推送目标
+    * ``param connected: Callable[[], Iterable[str]]`` 获取当前在线的 Bot
+    """
+
+    def __init__(
+        self, reach: Dict[str, Set[str]], connected: Callable[[], Iterable[str]]
+    ) -> None:
+        self.reach, self.connected = reach, connected
+        self.load = {bot_id: 0 for bot_id in reach}
+        # 每个 Bot 单独限速，互不占用发送额度
+        self.buckets = {
+            bot_id: TokenBucket(PUSH_RATE, PUSH_CONCURRENCY) for bot_id in reach
+        }
+        self.slots = {bot_id: asyncio.Semaphore(PUSH_CONCURRENCY) for bot_id in reach}
+
+    def online(self, bot_id: Optional[str]) -> bool:
+        return bot_id in self.reach and bot_id in set(self.connected())
+
+    def pick(self, target: str, exclude: Iterable[str] = ()) -> Optional[str]:
+        """为推送目标选择 Bot，没有在线 Bot 时返回空"""
+
+        online = set(self.connected()) - set(exclude)
+        candidates = [b for b in self.reach if b in online and target in self.reach[b]]
+        if not candidates:
+            # 无法确认可触达时交给任意在线 Bot 尝试
+            candidates = [b for b in self.reach if b in online]
+        if not candidates:
+            return None
+        bot_id = min(candidates, key=lambda b: self.load[b])
+        self.load[bot_id] += 1
+        return bot_id
+
+
+PUSH_PROGRESS = PushProgress(CONFIG_DIR / "cache" / "push.json")
+_push_lock: Optional[asyncio.Lock] = None
+
+
+def push_lock() -> asyncio.Lock:
+    """推送锁，从生成图片开始持有，同一时间只进行一次推送"""
+
+    global _push_lock
+    if _push_lock is None:
+        _push_lock = asyncio.Lock()
+    return _push_lock
+
+
+def push_running() -> bool:
+    """是否有推送正在进行"""
+
+    return _push_lock is not None and _push_lock.locked()
+
+
+async def run_push(
+    targets: List[str],
+    send: Callable[[str, str], Awaitable[None]],
+    shards: BotShards,
+) -> None:
+    """
+    限速并发推送
+    * ``param targets: List[str]`` 推送目标，以 ``群组:123`` ``私聊:456`` 形式表示
+    * ``param send: Callable[[str, str], Awaitable[None]]`` 使用指定 Bot 发送，失败时抛出异常
+    * ``param shards: BotShards`` 推送目标在各 Bot 间的分配
+    * 调用方需持有 ``push_lock()``
+    """
+
+    pending = PUSH_PROGRESS.start(targets)
+    assigned = {target: shards.pick(target) for target in pending}
+    logger.info(
+        f"每日材料推送开始，共 {len(targets)} 个目标，待推送 {len(pending)} 个，"
+        f"分配到 {len(set(assigned.values()) - {None})} 个 Bot"
+    )
+    left = 0
+
+    async def _send(target: str) -> None:
+        nonlocal left
+        bot_id, attempt = assigned[target], 0
+        while True:
+            if not shards.online(bot_id):
+                # Bot 掉线时剩余目标转交其他在线 Bot
+                bot_id = shards.pick(target, exclude=[bot_id] if bot_id else [])
+                if bot_id is None:
+                    logger.warning(f"没有在线 Bot 可推送 {target}，等待重新连接后继续")
+                    left += 1
+                    return
+            # 随机抖动代替固定间隔，避免同一时刻集中发送
+            await asyncio.sleep(uniform(0, 0.5 / PUSH_RATE))
+            await shards.buckets[bot_id].acquire()
+            try:
+                async with shards.slots[bot_id]:
+                    await send(bot_id, target)
+                PUSH_PROGRESS.mark(target, True)
+                return
+            except Exception as e:
+                if not shards.online(bot_id):
+                    continue
+                if attempt == PUSH_RETRY:
+                    logger.opt(exception=e).error(f"每日材料推送 {target} 失败")
+                    PUSH_PROGRESS.mark(target, False)
+                    return
+                backoff = min(2**attempt * 5, 60) * uniform(0.5, 1.5)
+                logger.warning(
+                    f"每日材料推送 {target} 出错，{backoff:.1f} 秒后重试：{e!r}"
+                )
+                attempt += 1
+                await asyncio.sleep(backoff)
+
+    await asyncio.gather(*[_send(target) for target in pending])
+    logger.info(f"每日材料推送结束 {PUSH_PROGRESS.finish(left)}")
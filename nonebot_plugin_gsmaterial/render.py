@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+from functools import partial
+from typing import Any, Dict, Callable, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from nonebot.log import logger
+
+from .config import RENDER_QUEUE, RENDER_PROCESS, RENDER_WORKERS
+
+
+class RenderQueueFull(RuntimeError):
+    """绘图任务排队数量超出上限"""
+
+
+class RenderExecutor:
+    """
+    绘图任务执行器，将完整的绘图任务放到事件循环之外执行
+    * ``param workers: int`` 同时执行的绘图任务数量
+    * ``param max_queue: int`` 等待执行的绘图任务数量上限，超出时直接拒绝用户触发的新任务
+    * ``param use_process: bool`` 是否使用进程池，仅支持 fork 的平台生效，否则使用线程池
+    """
+
+    def __init__(self, workers: int, max_queue: int, use_process: bool) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_process = use_process and (
+            "fork" in multiprocessing.get_all_start_methods()
+        )
+        self.queued, self.running = 0, 0
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            self._pool = (
+                ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("fork")
+                )
+                if self.use_process
+                else ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="gsmaterial-render"
+                )
+            )
+        return self._pool
+
+    def stats(self) -> Dict[str, int]:
+        """当前排队及执行中的绘图任务数量"""
+
+        return {"queued": self.queued, "running": self.running}
+
+    async def submit(
+        self, func: Callable[..., Any], *args: Any, block: bool = False, **kwargs: Any
+    ) -> Any:
+        """
+        提交绘图任务并等待结果，排队已满时抛出 ``RenderQueueFull``
+        * ``param block: bool = False`` 排队已满时是否继续等待，用于材料更新等内部批量任务
+        """
+
+        if self._slots is None:
+            # 延迟创建，确保绑定到正在运行的事件循环
+            self._slots = asyncio.Semaphore(self.workers)
+        if not block and self.queued >= self.max_queue:
+            raise RenderQueueFull(f"绘图任务排队已满 {self.stats()}")
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            logger.debug(f"绘图任务 {func.__name__} 开始执行 {self.stats()}")
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_pool(), partial(func, *args, **kwargs)
+            )
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def recycle(self) -> None:
+        """关闭当前的执行池，下次提交任务时重新创建"""
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    async def shutdown(self) -> None:
+        """关闭执行器，用于 NoneBot2 关闭时清理"""
+
+        self.recycle()
+
+
+render_executor = RenderExecutor(RENDER_WORKERS, RENDER_QUEUE, RENDER_PROCESS)
@@ -0,0 +1,117 @@
+import os
+import json
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
+
+from .config import CONFIG_DIR, SKIP_THREE
+
+
+def parse_variant(variant: str) -> Tuple[str, bool]:
+    """
+    订阅内容解析，``variant`` 形如 ``all`` ``weapon.3`` ``avatar.4``
+    * 前半部分为材料类型 ``all`` ``avatar`` ``weapon``
+    * 后缀 ``.3`` 包含三星物品，``.4`` 跳过三星物品，无后缀时按环境变量
+    - ``return: Tuple[str, bool]`` 材料类型、是否跳过三星物品
+    """
+
+    need, _, policy = variant.partition(".")
+    return need or "all", {"3": False, "4": True}.get(policy, SKIP_THREE)
+
+
+class SubStore:
+    """
+    订阅存储，首次使用时将 ``sub.json`` 读入内存索引，修改后整体原子写入
+    * 以有序字典代替集合，判断是否订阅为 O(1) 且保留订阅顺序
+    * 修改在锁内完成，并发的订阅指令不会互相覆盖
+    * 订阅内容不是默认的 ``all`` 时记录在 ``变体`` 中
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._subs: Optional[Dict[str, Dict[int, None]]] = None
+        self._variants: Dict[str, str] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def subs(self) -> Dict[str, Dict[int, None]]:
+        if self._subs is None:
+            raw = json.loads(self.path.read_text(encoding="UTF-8"))
+            self._subs = {
+                key: dict.fromkeys(int(i) for i in raw.get(key, []))
+                for key in ["群组", "私聊"]
+            }
+            self._variants = dict(raw.get("变体", {}))
+        return self._subs
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def snapshot(self) -> Dict:
+        """``sub.json`` 格式的订阅配置副本"""
+
+        sub_cfg: Dict = {key: list(ids) for key, ids in self.subs.items()}
+        sub_cfg["变体"] = dict(self._variants)
+        return sub_cfg
+
+    def contains(self, key: str, id: int) -> bool:
+        return id in self.subs[key]
+
+    def targets(self) -> List[str]:
+        """全部推送目标，以 ``群组:123`` ``私聊:456`` 形式表示"""
+
+        return [f"{key}:{id}" for key, ids in self.subs.items() for id in ids]
+
+    def by_variant(self) -> Dict[Tuple[str, bool], List[str]]:
+        """
+        按实际订阅内容分组的推送目标
+        * 以 ``parse_variant`` 解析后的材料类型、是否跳过三星物品为键，图片相同的订阅合为一组
+        """
+
+        groups: Dict[Tuple[str, bool], List[str]] = {}
+        for target in self.targets():
+            variant = parse_variant(self._variants.get(target, "all"))
+            groups.setdefault(variant, []).append(target)
+        return groups
+
+    async def update(
+        self, key: str, id: int, subscribe: bool, variant: str = "all"
+    ) -> bool:
+        """
+        添加或删除订阅，已订阅时可修改订阅内容
+        - ``return: bool`` 订阅状态或订阅内容是否发生变化
+        """
+
+        async with self.lock:
+            ids, target = self.subs[key], f"{key}:{id}"
+            if subscribe:
+                if id in ids and self._variants.get(target, "all") == variant:
+                    return False
+                ids[id] = None
+                if variant == "all":
+                    self._variants.pop(target, None)
+                else:
+                    self._variants[target] = variant
+            else:
+                if id not in ids:
+                    return False
+                del ids[id]
+                self._variants.pop(target, None)
+            # 写入在锁内完成，磁盘内容与修改顺序一致
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._save, self.snapshot()
+            )
+            return True
+
+    def _save(self, sub_cfg: Dict) -> None:
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        tmp.write_text(
+            json.dumps(sub_cfg, ensure_ascii=False, indent=2), encoding="UTF-8"
+        )
+        os.replace(tmp, self.path)
+
+
+SUB_STORE = SubStore(CONFIG_DIR / "sub.json")